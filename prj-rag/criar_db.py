@@ -1,46 +1,197 @@
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
 
+from embeddings import EmbeddingsComCache, EmbeddingsEmLotes
+
 PASTA_BASE = "base"
+CAMINHO_DB = "db"
+# Hash de cada PDF já vetorizado e os ids dos chunks que ele gerou
+CAMINHO_MANIFESTO = os.path.join(CAMINHO_DB, "manifesto.json")
+# Chunks acumulados (de um ou mais PDFs) antes de vetorizar e gravar no banco;
+# o manifesto é salvo a cada gravação, então uma execução interrompida continua dali
+LOTE_GRAVACAO = 500
+# Chamadas de embedding: textos por chamada, chamadas simultâneas e orçamento
+# de tokens por minuto do text-embedding-3-small
+TAMANHO_LOTE = 100
+CONCORRENCIA = 4
+TOKENS_POR_MINUTO = 1_000_000
 
 load_dotenv()
 
-def criar_db():
-    #carregar_docs
-    #dividir em pedaços(chukns)
-    #vetorizar os chunks com processos de embedding
-    
-    documentos = carregar_documentos()
-    chunks = dividir_chunks(documentos)
-    # print(len(chunks))
-    vetorizar_chunks(chunks)
-    print("Chunks criados")
-    
-def carregar_documentos():
-    loaderPDF = PyPDFDirectoryLoader(PASTA_BASE, glob="*.pdf")
-    documentos = loaderPDF.load()
-    return documentos
-    
+def criar_db(completo=False, processos=None, embedding=None):
+    #comparar o hash dos PDFs com o manifesto da última execução
+    #carregar e dividir em pedaços(chunks) só os PDFs novos ou alterados, em paralelo
+    #vetorizar em lotes, conforme os PDFs ficam prontos, só os chunks que ainda não
+    #estão no banco, e apagar os que sumiram
+
+    if not os.path.exists(CAMINHO_MANIFESTO) and os.path.exists(CAMINHO_DB):
+        # Banco criado antes do manifesto: não dá para saber o que já está nele
+        print("Banco sem manifesto, recriando do zero")
+        completo = True
+    if completo and os.path.exists(CAMINHO_DB):
+        shutil.rmtree(CAMINHO_DB)
+
+    manifesto = carregar_manifesto()
+    arquivos = listar_pdfs()
+    alterados = [arquivo for arquivo, hash_arquivo in arquivos.items()
+                 if manifesto.get(arquivo, {}).get("hash") != hash_arquivo]
+    removidos = [arquivo for arquivo in manifesto if arquivo not in arquivos]
+    if not alterados and not removidos:
+        print("Nenhum PDF novo, alterado ou removido")
+        return
+
+    db = abrir_db(embedding)
+    try:
+        apagados = []
+        for arquivo in removidos:
+            apagados.extend(manifesto.pop(arquivo)["chunks"])
+        apagar_chunks(db, apagados)
+
+        pendentes = {}   # chunks ainda não gravados (de um ou mais PDFs)
+        aguardando = {}  # entradas do manifesto dos PDFs com chunks pendentes
+        vetorizados = 0
+        processados = 0
+        for arquivo, chunks in carregar_chunks(alterados, processos):
+            chunks_arquivo = {id_chunk(chunk): chunk for chunk in chunks}
+            # Chunks que não mudaram mantêm o id e não são vetorizados de novo
+            antigos = set(manifesto.get(arquivo, {}).get("chunks", []))
+            apagar = [id_antigo for id_antigo in antigos if id_antigo not in chunks_arquivo]
+            apagar_chunks(db, apagar)
+            apagados.extend(apagar)
+            pendentes.update((id_novo, chunk) for id_novo, chunk in chunks_arquivo.items() if id_novo not in antigos)
+            aguardando[arquivo] = {"hash": arquivos[arquivo], "chunks": list(chunks_arquivo)}
+            processados += 1
+            if len(pendentes) >= LOTE_GRAVACAO:
+                vetorizados += vetorizar_chunks(db, pendentes)
+                gravar_checkpoint(manifesto, pendentes, aguardando)
+        vetorizados += vetorizar_chunks(db, pendentes)
+        gravar_checkpoint(manifesto, pendentes, aguardando)
+
+        print(f"PDFs alterados: {processados}/{len(alterados)}, removidos: {len(removidos)}")
+        print(f"Chunks vetorizados: {vetorizados}, apagados: {len(apagados)}")
+        print(f"Embeddings do cache: {db.embeddings.acertos}, da API: {db.embeddings.faltas}")
+    finally:
+        db.embeddings.fechar()
+
+def gravar_checkpoint(manifesto, pendentes, aguardando):
+    # Sempre depois de gravar no banco: se falhar no meio, a próxima execução
+    # refaz só os PDFs que não chegaram ao manifesto
+    manifesto.update(aguardando)
+    salvar_manifesto(manifesto)
+    pendentes.clear()
+    aguardando.clear()
+
+def listar_pdfs():
+    return {arquivo: hash_arquivo(arquivo)
+            for arquivo in sorted(glob.glob(os.path.join(PASTA_BASE, "*.pdf")))}
+
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def id_chunk(chunk):
+    # Hash do conteúdo (com arquivo e página, para não colidir entre PDFs)
+    dados = f"{chunk.metadata['source']}\0{chunk.metadata.get('page')}\0{chunk.page_content}"
+    return hashlib.sha256(dados.encode("utf-8")).hexdigest()
+
+def carregar_manifesto():
+    if not os.path.exists(CAMINHO_MANIFESTO):
+        return {}
+    with open(CAMINHO_MANIFESTO, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+def salvar_manifesto(manifesto):
+    os.makedirs(CAMINHO_DB, exist_ok=True)
+    temporario = CAMINHO_MANIFESTO + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+    os.replace(temporario, CAMINHO_MANIFESTO)
+
+def carregar_chunks(arquivos, processos=None):
+    # Lê e divide os PDFs em processos separados (é CPU) e entrega os chunks de
+    # cada PDF assim que ele termina, fora de ordem. No máximo 2 PDFs por processo
+    # ficam na fila, para não acumular chunks prontos em memória
+    processos = processos or os.cpu_count() or 1
+    fila = iter(arquivos)
+    pool = ProcessPoolExecutor(max_workers=processos)
+    try:
+        pendentes = {pool.submit(processar_pdf, arquivo): arquivo
+                     for _, arquivo in zip(range(processos * 2), fila)}
+        while pendentes:
+            prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                arquivo = pendentes.pop(futuro)
+                proximo = next(fila, None)
+                if proximo is not None:
+                    pendentes[pool.submit(processar_pdf, proximo)] = proximo
+                try:
+                    chunks = futuro.result()
+                except Exception as erro:
+                    # Fica fora do manifesto e é tentado de novo na próxima execução
+                    print(f"Erro ao ler {arquivo}: {erro}")
+                    continue
+                yield arquivo, chunks
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def processar_pdf(arquivo):
+    return dividir_chunks(PyPDFLoader(arquivo).load())
+
 def dividir_chunks(documentos):
     separador_documentos = RecursiveCharacterTextSplitter(
         chunk_size=1700,
-        chunk_overlap=600,                
+        chunk_overlap=600,
         length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]        
+        separators=["\n\n", "\n", ". ", " ", ""]
     )
     chunks = separador_documentos.split_documents(documentos)
-    return chunks    
-
-def vetorizar_chunks(chunks):
-    embedding = OpenAIEmbeddings(model="text-embedding-3-small")
-    db = Chroma.from_documents(chunks,
-                               embedding, 
-                               persist_directory="db"
-                               )#Cria o banco vetorizado
-    
-    
-        
-criar_db()
\ No newline at end of file
+    return chunks
+
+def abrir_db(embedding=None):
+    # embedding: outro Embeddings no lugar do da OpenAI (ex.: um fake para testes)
+    if embedding is None:
+        # As novas tentativas ficam por conta do EmbeddingsEmLotes
+        embedding = OpenAIEmbeddings(model="text-embedding-3-small", max_retries=0)
+    # O cache fica na frente: textos já vetorizados não gastam o orçamento de tokens
+    embedding = EmbeddingsComCache(EmbeddingsEmLotes(embedding, TAMANHO_LOTE, CONCORRENCIA, TOKENS_POR_MINUTO),
+                                   modelo=getattr(embedding, "model", None) or type(embedding).__name__)
+    return Chroma(persist_directory=CAMINHO_DB, embedding_function=embedding)
+
+def apagar_chunks(db, ids):
+    if ids:
+        db.delete(ids=list(ids))
+
+def vetorizar_chunks(db, chunks):
+    # Chunks já gravados por uma execução interrompida (mesmo id) não são
+    # vetorizados de novo
+    if not chunks:
+        return 0
+    existentes = set(db.get(ids=list(chunks), include=[])["ids"])
+    faltando = {id_novo: chunk for id_novo, chunk in chunks.items() if id_novo not in existentes}
+    if faltando:
+        db.add_documents(list(faltando.values()), ids=list(faltando))#Grava no banco vetorizado
+    return len(faltando)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cria/atualiza o banco vetorizado com os PDFs de base/")
+    parser.add_argument("--full", action="store_true",
+                        help="apaga o banco e vetoriza todos os PDFs de novo")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="processos lendo PDFs em paralelo (padrão: número de CPUs)")
+    args = parser.parse_args()
+    criar_db(completo=args.full, processos=args.processos)
@@ -0,0 +1,240 @@
+"""
+Embeddings em lotes para a ingestão do prj-rag.
+
+`EmbeddingsEmLotes` envolve qualquer `Embeddings` do LangChain (o da OpenAI
+ou um fake local) e é passado ao Chroma no lugar dele: os textos são
+enviados em lotes de `tamanho_lote`, com até `concorrencia` lotes ao mesmo
+tempo, respeitando um orçamento de tokens por minuto e tentando de novo
+os erros temporários (rate limit, timeout, conexão, 5xx).
+
+`EmbeddingsComCache` guarda cada vetor em SQLite por (modelo, sha256 do
+texto): chunks repetidos (overlap, PDFs reenviados) e perguntas repetidas
+não chamam a API de novo. É usado na ingestão e nas perguntas.
+"""
+
+import asyncio
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from array import array
+
+import openai
+from langchain_core.embeddings import Embeddings
+
+ERROS_TEMPORARIOS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Fora da pasta do banco vetorizado: sobrevive ao criar_db --full
+CAMINHO_CACHE = "cache_embeddings.db"
+
+
+def estimar_tokens(texto):
+    # ~4 caracteres por token, sem precisar baixar o tokenizer
+    return len(texto) // 4 + 1
+
+
+class LimiteTokens:
+    """
+    Balde de tokens: enche `tokens_por_minuto` por minuto (0 = sem limite).
+    """
+
+    def __init__(self, tokens_por_minuto=0):
+        self.capacidade = tokens_por_minuto
+        self.disponivel = tokens_por_minuto
+        self.atualizado_em = time.monotonic()
+
+    async def reservar(self, tokens):
+        if not self.capacidade:
+            return
+        # Um lote maior que o balde inteiro espera o balde encher e passa
+        tokens = min(tokens, self.capacidade)
+        while True:
+            agora = time.monotonic()
+            self.disponivel = min(
+                self.capacidade,
+                self.disponivel + (agora - self.atualizado_em) * self.capacidade / 60,
+            )
+            self.atualizado_em = agora
+            if self.disponivel >= tokens:
+                self.disponivel -= tokens
+                return
+            await asyncio.sleep((tokens - self.disponivel) * 60 / self.capacidade)
+
+
+class EmbeddingsEmLotes(Embeddings):
+    """
+    Args:
+        base: Embeddings que faz a chamada de verdade
+        tamanho_lote: Textos por chamada
+        concorrencia: Chamadas simultâneas
+        tokens_por_minuto: Orçamento de tokens (0 = sem limite)
+        tentativas: Tentativas por lote em erros temporários
+        espera_inicial: Espera (s) antes da 2ª tentativa; dobra a cada erro
+        contar_tokens: Função texto -> tokens usada no orçamento
+    """
+
+    def __init__(
+        self,
+        base,
+        tamanho_lote=100,
+        concorrencia=4,
+        tokens_por_minuto=0,
+        tentativas=5,
+        espera_inicial=1.0,
+        contar_tokens=estimar_tokens,
+    ):
+        self.base = base
+        self.tamanho_lote = tamanho_lote
+        self.concorrencia = concorrencia
+        self.limite = LimiteTokens(tokens_por_minuto)
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+        self.contar_tokens = contar_tokens
+        # Um único event loop para todas as chamadas síncronas: o cliente
+        # assíncrono da OpenAI guarda conexões presas ao loop em que foram abertas
+        self._runner = None
+        self._runner_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        # O Chroma chama a versão síncrona; a concorrência fica dentro do loop
+        with self._runner_lock:
+            if self._runner is None:
+                self._runner = asyncio.Runner()
+            return self._runner.run(self.aembed_documents(texts))
+
+    def fechar(self):
+        with self._runner_lock:
+            if self._runner is not None:
+                self._runner.close()
+                self._runner = None
+
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await self.base.aembed_query(text)
+
+    async def aembed_documents(self, texts):
+        semaforo = asyncio.Semaphore(self.concorrencia)
+
+        async def vetorizar_lote(lote):
+            async with semaforo:
+                await self.limite.reservar(sum(self.contar_tokens(texto) for texto in lote))
+                return await self._vetorizar_com_retry(lote)
+
+        lotes = [texts[inicio:inicio + self.tamanho_lote] for inicio in range(0, len(texts), self.tamanho_lote)]
+        resultados = await asyncio.gather(*(vetorizar_lote(lote) for lote in lotes))
+        return [vetor for lote in resultados for vetor in lote]
+
+    async def _vetorizar_com_retry(self, lote):
+        for tentativa in range(self.tentativas):
+            try:
+                return await self.base.aembed_documents(lote)
+            except ERROS_TEMPORARIOS as erro:
+                if tentativa == self.tentativas - 1:
+                    raise
+                # Backoff exponencial com jitter, para os lotes não voltarem juntos
+                espera = min(60, self.espera_inicial * 2 ** tentativa) * random.uniform(0.5, 1.5)
+                print(f"Erro ao vetorizar lote ({erro}), nova tentativa em {espera:.1f}s")
+                await asyncio.sleep(espera)
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    Cache persistente de embeddings na frente de outro `Embeddings`.
+
+    Os vetores são gravados como float32 (metade do tamanho, sem diferença
+    prática na similaridade).
+
+    Args:
+        base: Embeddings chamado só para os textos fora do cache
+        modelo: Parte da chave; padrão: `base.model` ou o nome da classe
+        caminho: Arquivo SQLite do cache
+    """
+
+    def __init__(self, base, modelo=None, caminho=CAMINHO_CACHE):
+        self.base = base
+        self.modelo = modelo or getattr(base, "model", None) or type(base).__name__
+        self.acertos = 0
+        self.faltas = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                modelo TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vetor BLOB NOT NULL,
+                PRIMARY KEY (modelo, hash)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def embed_documents(self, texts):
+        vetores, faltando = self._buscar(texts)
+        if faltando:
+            novos = self._guardar(faltando, self.base.embed_documents(list(faltando)))
+            vetores = [vetor if vetor is not None else novos[texto] for texto, vetor in zip(texts, vetores)]
+        return vetores
+
+    async def aembed_documents(self, texts):
+        vetores, faltando = self._buscar(texts)
+        if faltando:
+            novos = self._guardar(faltando, await self.base.aembed_documents(list(faltando)))
+            vetores = [vetor if vetor is not None else novos[texto] for texto, vetor in zip(texts, vetores)]
+        return vetores
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def fechar(self):
+        with self._lock:
+            self._conn.close()
+        fechar_base = getattr(self.base, "fechar", None)
+        if fechar_base is not None:
+            fechar_base()
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def _buscar(self, textos):
+        hashes = [hashlib.sha256(texto.encode("utf-8")).hexdigest() for texto in textos]
+        encontrados = {}
+        with self._lock:
+            # Em partes, abaixo do limite de parâmetros do SQLite
+            for inicio in range(0, len(hashes), 500):
+                parte = hashes[inicio:inicio + 500]
+                encontrados.update(self._conn.execute(
+                    f"SELECT hash, vetor FROM embeddings WHERE modelo = ? AND hash IN ({','.join('?' * len(parte))})",
+                    (self.modelo, *parte),
+                ).fetchall())
+        vetores = []
+        faltando = {}  # texto -> hash, sem repetir textos iguais
+        for texto, hash_texto in zip(textos, hashes):
+            blob = encontrados.get(hash_texto)
+            if blob is None:
+                faltando[texto] = hash_texto
+                vetores.append(None)
+            else:
+                vetores.append(array("f", blob).tolist())
+        self.acertos += len(textos) - len(faltando)
+        self.faltas += len(faltando)
+        return vetores, faltando
+
+    def _guardar(self, faltando, vetores):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (modelo, hash, vetor) VALUES (?, ?, ?)",
+                [(self.modelo, hash_texto, array("f", vetor).tobytes())
+                 for hash_texto, vetor in zip(faltando.values(), vetores)],
+            )
+        return dict(zip(faltando, vetores))
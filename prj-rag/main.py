@@ -1,12 +1,20 @@
+import argparse
+import asyncio
+import sys
+
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
+from embeddings import EmbeddingsComCache
+
 load_dotenv()
 
 CAMINHO_DB = "db"
+# Perguntas respondidas ao mesmo tempo no modo lote
+CONCORRENCIA = 8
 
 prompt_template = """
 Você é um especialista em suporte.
@@ -19,49 +27,101 @@ Pergunta do cliente:
 Responda educadamente a pergunta, baseado no contexto acima. 
 """
 
-def perguntar():
-    pergunta = input("Faça uma pergunta sobre a empresa: ")
+class AssistenteRAG:
+    # Abre o banco vetorizado e cria os clientes uma única vez: o índice do
+    # Chroma, as conexões HTTP e o cache de embeddings ficam quentes entre as
+    # perguntas, e responder() pode ser chamado para várias ao mesmo tempo
 
-    embedding = OpenAIEmbeddings(model="text-embedding-3-small")
-    db = Chroma(
-        persist_directory=CAMINHO_DB, 
-        embedding_function=embedding
-    )
+    def __init__(self):
+        # Perguntas repetidas usam o vetor do cache (o mesmo da ingestão)
+        embedding = EmbeddingsComCache(OpenAIEmbeddings(model="text-embedding-3-small"))
+        self.db = Chroma(
+            persist_directory=CAMINHO_DB,
+            embedding_function=embedding
+        )
+        self.prompt = ChatPromptTemplate.from_template(prompt_template)
+        self.modelo = ChatOpenAI()
 
-    resultados = db.similarity_search_with_score(pergunta, k=3)#numero de resultados
-    
-    # print(resultados)
-    # return
+    async def aquecer(self):
+        # Carrega o índice do Chroma antes da primeira pergunta de verdade
+        await self.db.asimilarity_search_with_score("aquecimento", k=1)
 
-    if len(resultados) == 0 :
-        print("Não foi possível encontrar uma informação")
-        return
-    
-    primeiro_score = resultados[0][1]
-    if primeiro_score < 0.7:
-        print(f"Não foi possível encontrar informação relevante (score: {primeiro_score:.4f})")
-        return
-    
-    textos = []
-    for documento, score in resultados:
-        texto = documento.page_content
-        textos.append(texto)
-        
-    base_conhecimento = "\n".join(textos)
-    prompt = ChatPromptTemplate.from_template(prompt_template)
-    prompt = prompt.invoke({
-        "pergunta": pergunta, 
-        "base_conhecimento": base_conhecimento
-        })
-    
-    
-    modelo = ChatOpenAI()
-    texto_resposta = modelo.invoke(prompt).content
-    
+    async def responder(self, pergunta):
+        resultados = await self.db.asimilarity_search_with_score(pergunta, k=3)#numero de resultados
+
+        if len(resultados) == 0 :
+            return "Não foi possível encontrar uma informação"
+
+        primeiro_score = resultados[0][1]
+        if primeiro_score < 0.7:
+            return f"Não foi possível encontrar informação relevante (score: {primeiro_score:.4f})"
+
+        textos = []
+        for documento, score in resultados:
+            texto = documento.page_content
+            textos.append(texto)
+
+        base_conhecimento = "\n".join(textos)
+        prompt = await self.prompt.ainvoke({
+            "pergunta": pergunta,
+            "base_conhecimento": base_conhecimento
+            })
+
+        resposta = await self.modelo.ainvoke(prompt)
+        return resposta.content
+
+def imprimir_resposta(texto_resposta, titulo="Informações encontradas:"):
     print("\n" + "="*50)
-    print("Informações encontradas:")
+    print(titulo)
     print("="*50)
     print(texto_resposta)
-    
-    
-perguntar()
\ No newline at end of file
+
+async def modo_interativo(assistente):
+    while True:
+        try:
+            pergunta = await asyncio.to_thread(input, "\nFaça uma pergunta sobre a empresa (vazio para sair): ")
+        except EOFError:
+            return
+        if not pergunta.strip():
+            return
+        imprimir_resposta(await assistente.responder(pergunta))
+
+async def responder_lote(assistente, perguntas, concorrencia=CONCORRENCIA):
+    # Respostas na ordem das perguntas; um erro em uma pergunta não para as outras
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def responder(pergunta):
+        async with semaforo:
+            return await assistente.responder(pergunta)
+
+    return await asyncio.gather(*(responder(pergunta) for pergunta in perguntas), return_exceptions=True)
+
+async def main(arquivo=None, concorrencia=CONCORRENCIA):
+    assistente = AssistenteRAG()
+    await assistente.aquecer()
+    if arquivo is None:
+        await modo_interativo(assistente)
+        return
+
+    if arquivo == "-":
+        linhas = sys.stdin.read().splitlines()
+    else:
+        with open(arquivo, encoding="utf-8") as entrada:
+            linhas = entrada.read().splitlines()
+    perguntas = [linha.strip() for linha in linhas if linha.strip()]
+    respostas = await responder_lote(assistente, perguntas, concorrencia)
+    for pergunta, resposta in zip(perguntas, respostas):
+        if isinstance(resposta, Exception):
+            resposta = f"Erro ao responder: {resposta}"
+        imprimir_resposta(resposta, titulo=pergunta)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Responde perguntas sobre a empresa com base nos PDFs vetorizados")
+    parser.add_argument("--arquivo", default=None,
+                        help="arquivo com uma pergunta por linha (- para ler da entrada padrão); "
+                             "sem ele, abre o modo interativo")
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA,
+                        help="perguntas respondidas ao mesmo tempo no modo lote")
+    args = parser.parse_args()
+    asyncio.run(main(args.arquivo, args.concorrencia))
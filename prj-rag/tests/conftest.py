@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os scripts do prj-rag usam imports simples (ex.: `from embeddings import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,233 @@
+import base64
+import json
+import threading
+from array import array
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+import embeddings
+from embeddings import EmbeddingsComCache, EmbeddingsEmLotes
+
+
+class _FakeOpenAI(BaseHTTPRequestHandler):
+    """
+    Imita o POST /v1/embeddings da OpenAI: o vetor de cada texto é
+    [tamanho do texto, 1.0].
+    """
+
+    # Keep-alive: a conexão aberta em uma chamada é reaproveitada na seguinte
+    protocol_version = "HTTP/1.1"
+    chamadas = 0
+
+    def do_POST(self):
+        corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).chamadas += 1
+        textos = corpo["input"] if isinstance(corpo["input"], list) else [corpo["input"]]
+        dados = []
+        for indice, texto in enumerate(textos):
+            vetor = [float(len(texto)), 1.0]
+            if corpo.get("encoding_format") == "base64":
+                vetor = base64.b64encode(array("f", vetor).tobytes()).decode()
+            dados.append({"object": "embedding", "index": indice, "embedding": vetor})
+        resposta = json.dumps({
+            "object": "list",
+            "data": dados,
+            "model": corpo["model"],
+            "usage": {"prompt_tokens": len(textos), "total_tokens": len(textos)},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeEmbeddings(Embeddings):
+    """
+    Embeddings local: o vetor de cada texto é [tamanho do texto, 1.0]; guarda
+    os textos de cada chamada.
+    """
+
+    def __init__(self):
+        self.chamadas = []
+
+    def embed_documents(self, texts):
+        self.chamadas.append(list(texts))
+        return [[float(len(texto)), 1.0] for texto in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class _FakeInstavel(_FakeEmbeddings):
+    """
+    Falha com um erro temporário nas primeiras `falhas` chamadas.
+    """
+
+    def __init__(self, falhas):
+        super().__init__()
+        self.falhas = falhas
+        self.tentativas = 0
+
+    async def aembed_documents(self, texts):
+        self.tentativas += 1
+        if self.tentativas <= self.falhas:
+            raise ConnectionError("conexão recusada")
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    """
+    Relógio simulado: asyncio.sleep só avança o tempo; o jitter do backoff é
+    fixo em 1. `esperas` guarda a duração de cada asyncio.sleep.
+    """
+    agora = [1000.0]
+    esperas = []
+
+    async def dormir(segundos):
+        esperas.append(segundos)
+        agora[0] += segundos
+
+    monkeypatch.setattr(embeddings.asyncio, "sleep", dormir)
+    monkeypatch.setattr(embeddings.time, "monotonic", lambda: agora[0])
+    monkeypatch.setattr(embeddings.random, "uniform", lambda inicio, fim: 1.0)
+    return SimpleNamespace(agora=agora, esperas=esperas)
+
+
+@pytest.fixture
+def servidor():
+    _FakeOpenAI.chamadas = 0
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _FakeOpenAI)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_embed_documents_varias_chamadas_com_cliente_http(servidor):
+    # Cada gravação do criar_db é uma chamada síncrona: o cliente assíncrono da
+    # OpenAI precisa continuar funcionando entre elas
+    base = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        api_key="sk-teste",
+        base_url=servidor,
+        max_retries=0,
+        check_embedding_ctx_length=False,
+    )
+    embedding = EmbeddingsEmLotes(base, tamanho_lote=2, concorrencia=2)
+    try:
+        for rodada in range(3):
+            textos = [f"texto {rodada}-{indice}" + "x" * indice for indice in range(5)]
+            vetores = embedding.embed_documents(textos)
+            assert [vetor[0] for vetor in vetores] == [float(len(texto)) for texto in textos]
+    finally:
+        embedding.fechar()
+    # 3 rodadas de 5 textos em lotes de 2
+    assert _FakeOpenAI.chamadas == 9
+
+
+def test_cache_nao_chama_a_base_para_textos_repetidos(tmp_path):
+    base = _FakeEmbeddings()
+    cache = EmbeddingsComCache(base, modelo="modelo-a", caminho=str(tmp_path / "cache.db"))
+    try:
+        # Textos repetidos na mesma chamada vão uma vez só para a base
+        vetores = cache.embed_documents(["a", "bb", "a"])
+        assert vetores == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+        assert base.chamadas == [["a", "bb"]]
+        # O "a" repetido não chega à API: conta como acerto
+        assert (cache.acertos, cache.faltas) == (1, 2)
+
+        # Chunks com overlap: só o texto novo chama a base
+        assert cache.embed_documents(["bb", "ccc", "a"]) == [[2.0, 1.0], [3.0, 1.0], [1.0, 1.0]]
+        assert base.chamadas[1:] == [["ccc"]]
+        assert (cache.acertos, cache.faltas) == (3, 3)
+
+        assert cache.embed_documents(["a", "bb", "ccc"]) == [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+        assert cache.embed_query("ccc") == [3.0, 1.0]
+        assert len(base.chamadas) == 2
+        assert (cache.acertos, cache.faltas) == (7, 3)
+    finally:
+        cache.fechar()
+
+
+def test_cache_separa_entradas_por_modelo(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+    base_a, base_b = _FakeEmbeddings(), _FakeEmbeddings()
+    cache_a = EmbeddingsComCache(base_a, modelo="modelo-a", caminho=caminho)
+    cache_b = EmbeddingsComCache(base_b, modelo="modelo-b", caminho=caminho)
+    try:
+        cache_a.embed_documents(["texto"])
+        # Mesmo arquivo, outro modelo: o vetor do modelo-a não é reaproveitado
+        cache_b.embed_documents(["texto"])
+        assert base_b.chamadas == [["texto"]]
+        assert (cache_b.acertos, cache_b.faltas) == (0, 1)
+    finally:
+        cache_a.fechar()
+        cache_b.fechar()
+
+    # Reaberto (ex.: próxima execução do criar_db), o cache continua valendo
+    base = _FakeEmbeddings()
+    cache = EmbeddingsComCache(base, modelo="modelo-a", caminho=caminho)
+    try:
+        assert cache.embed_documents(["texto"]) == [[5.0, 1.0]]
+        assert base.chamadas == []
+        assert (cache.acertos, cache.faltas) == (1, 0)
+    finally:
+        cache.fechar()
+
+
+def test_lote_tenta_de_novo_apos_erro_temporario(relogio):
+    base = _FakeInstavel(falhas=2)
+    embedding = EmbeddingsEmLotes(base, tamanho_lote=10, tentativas=5, espera_inicial=1.0)
+    try:
+        assert embedding.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    finally:
+        embedding.fechar()
+    assert base.tentativas == 3
+    # Backoff exponencial: 1 s e depois 2 s
+    assert relogio.esperas == [1.0, 2.0]
+
+
+def test_lote_desiste_depois_das_tentativas(relogio):
+    base = _FakeInstavel(falhas=10)
+    embedding = EmbeddingsEmLotes(base, tamanho_lote=10, tentativas=3, espera_inicial=1.0)
+    try:
+        with pytest.raises(ConnectionError):
+            embedding.embed_documents(["a"])
+    finally:
+        embedding.fechar()
+    assert base.tentativas == 3
+    # Sem espera depois da última tentativa
+    assert relogio.esperas == [1.0, 2.0]
+
+
+def test_lotes_respeitam_tokens_por_minuto(relogio):
+    inicio = relogio.agora[0]
+    enviados = []  # (segundos desde o início, tokens do lote)
+
+    class Base(_FakeEmbeddings):
+        async def aembed_documents(self, texts):
+            enviados.append((relogio.agora[0] - inicio, 100 * len(texts)))
+            return self.embed_documents(texts)
+
+    embedding = EmbeddingsEmLotes(
+        Base(), tamanho_lote=1, concorrencia=2, tokens_por_minuto=600, contar_tokens=lambda texto: 100)
+    try:
+        vetores = embedding.embed_documents([f"texto {indice}" for indice in range(10)])
+    finally:
+        embedding.fechar()
+    assert len(vetores) == 10 and len(enviados) == 10
+    # O balde começa cheio (6 lotes) e enche 100 tokens a cada 10 s
+    for segundos, _ in enviados:
+        gastos = sum(tokens for outro, tokens in enviados if outro <= segundos)
+        assert gastos <= 600 + 10 * segundos + 1e-6
+    assert max(segundos for segundos, _ in enviados) == pytest.approx(40)
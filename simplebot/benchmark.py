@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do SimpleBot (não chamam a OpenAI).
+
+Uso:
+    python benchmark.py history    # custo por turno para montar o histórico do /chat
+    python benchmark.py auth       # custo da verificação de JWT por requisição
+    python benchmark.py middleware # req/s e throughput SSE: BaseHTTPMiddleware x ASGI puro
+    python benchmark.py load       # carga nas rotas da app com um LLM fake (RPS, p50/p95/p99, memória)
+    python benchmark.py startup    # tempo de import do main.py (-X importtime) e do lifespan
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from context import ContextWindow
+from store import InMemoryConversationStore
+
+
+def _per_call_us(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+def bench_history(args) -> None:
+    """
+    Compara a montagem do histórico por turno:
+    - antes: copiar o histórico e converter todas as mensagens a cada turno
+    - agora: mensagens convertidas em cache + janela de tokens
+    """
+    print(f"{'mensagens':>10} {'antes (us)':>12} {'agora (us)':>12}")
+    for size in args.sizes:
+        store = InMemoryConversationStore()
+        window = ContextWindow(store, max_tokens=args.max_tokens)
+        conversation_id = store.get_or_create_conversation("bench")
+        for i in range(size):
+            role = "user" if i % 2 == 0 else "assistant"
+            store.add_message("bench", conversation_id, role, f"mensagem {i} " * 10)
+
+        def before():
+            langchain_messages = []
+            for message in store.get_messages("bench", conversation_id):
+                if message["role"] == "user":
+                    langchain_messages.append(HumanMessage(content=message["content"]))
+                if message["role"] == "assistant":
+                    langchain_messages.append(AIMessage(content=message["content"]))
+
+        loop = asyncio.new_event_loop()
+
+        def after():
+            loop.run_until_complete(window.build("bench", conversation_id))
+
+        before_us = _per_call_us(before, args.repeat)
+        after_us = _per_call_us(after, args.repeat)
+        loop.close()
+        print(f"{size:>10} {before_us:>12.1f} {after_us:>12.1f}")
+
+
+def _import_app():
+    """
+    Importa main.py com configuração mínima para rodar sem .env.
+    """
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    import main as app_module
+    return app_module
+
+
+def bench_auth(args) -> None:
+    """
+    Compara a verificação de JWT por requisição em rota com rate limit
+    (chave do limiter + get_current_user):
+    - antes: dois jwt.decode
+    - agora: cache de tokens verificados
+    """
+    app_module = _import_app()
+    token = app_module.create_access_token(data={"sub": "bench"})
+
+    from jose import jwt
+
+    settings = app_module.settings
+
+    def before():
+        jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.algorithm])
+        jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.algorithm])
+
+    def after():
+        app_module.decode_token(token)
+        app_module.verify_token(token, expected_type="access")
+
+    print(f"antes: {_per_call_us(before, args.repeat):8.1f} us/requisição")
+    print(f"agora: {_per_call_us(after, args.repeat):8.1f} us/requisição")
+
+
+def _middleware_app(legacy: bool):
+    """
+    App mínima com CORS + headers de segurança + log de requisições, usando a
+    pilha antiga (BaseHTTPMiddleware) ou a atual (ASGI puro).
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import StreamingResponse
+    from starlette.middleware.base import BaseHTTPMiddleware
+
+    from middleware import API_SECURITY_HEADERS, RequestLoggingMiddleware, SecurityHeadersMiddleware
+
+    def log(level, message, **kwargs):
+        pass
+
+    class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            response = await call_next(request)
+            for name, value in API_SECURITY_HEADERS:
+                response.headers[name.decode()] = value.decode()
+            return response
+
+    class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request: Request, call_next):
+            start_time = time.time()
+            response = await call_next(request)
+            log("INFO", "Request processada", method=request.method, path=str(request.url.path),
+                status_code=response.status_code, duration_ms=round((time.time() - start_time) * 1000, 2))
+            return response
+
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, allow_origins=["http://localhost"], allow_methods=["*"], allow_headers=["*"])
+    if legacy:
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+        app.add_middleware(LegacyRequestLoggingMiddleware)
+    else:
+        app.add_middleware(SecurityHeadersMiddleware)
+        app.add_middleware(RequestLoggingMiddleware, log=log)
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "ok"}
+
+    @app.get("/sse")
+    async def sse(events: int = 200):
+        async def stream():
+            for _ in range(events):
+                yield "data: token\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+async def _drive(app, path: str, requests: int, concurrency: int) -> float:
+    """
+    Executa `requests` GETs com `concurrency` clientes; retorna a duração em segundos.
+    """
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = iter(range(requests))
+
+        async def worker():
+            for _ in remaining:
+                response = await client.get(path)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def bench_middleware(args) -> None:
+    """
+    Compara a pilha de middlewares antiga (BaseHTTPMiddleware) com a ASGI pura.
+    """
+    print(f"{'pilha':>8} {'req/s':>10} {'eventos SSE/s':>15}")
+    for name, legacy in (("antiga", True), ("asgi", False)):
+        app = _middleware_app(legacy)
+        elapsed = asyncio.run(_drive(app, "/ping", args.requests, args.concurrency))
+        rps = args.requests / elapsed
+        streams = max(1, args.requests // 10)
+        elapsed = asyncio.run(_drive(app, f"/sse?events={args.events}", streams, args.concurrency))
+        events_per_second = streams * args.events / elapsed
+        print(f"{name:>8} {rps:>10.0f} {events_per_second:>15.0f}")
+
+
+class FakeChatModel:
+    """
+    LLM local e determinístico no lugar do ChatOpenAI: responde sempre as
+    mesmas `tokens` palavras, esperando `token_latency` segundos por token.
+    """
+
+    def __init__(self, tokens: int = 50, token_latency: float = 0.0, **kwargs):
+        self.words = [f"token{i} " for i in range(tokens)]
+        self.token_latency = token_latency
+
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+
+        for word in self.words:
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=word)
+
+    async def ainvoke(self, messages):
+        if self.token_latency:
+            await asyncio.sleep(self.token_latency * len(self.words))
+        return AIMessage(content="".join(self.words))
+
+
+def _rss_mb() -> float:
+    """
+    Memória residente atual do processo (MB).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Fora do Linux: pico de memória (ru_maxrss em KB no Linux, bytes no macOS)
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def _percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+async def _run_scenario(send, requests: int, concurrency: int):
+    """
+    Executa `send(i)` `requests` vezes com `concurrency` clientes;
+    retorna (duração em segundos, latências em segundos).
+    """
+    remaining = iter(range(requests))
+    latencies = []
+
+    async def worker():
+        for i in remaining:
+            start = time.perf_counter()
+            response = await send(i)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, latencies
+
+
+async def _load(args):
+    import httpx
+
+    app_module = _import_app()
+    app_module.logger.setLevel(logging.WARNING)
+    app_module.limiter.enabled = args.rate_limit
+    if not args.rate_limit:
+        # Um único usuário abre todos os streams: sem o limite por usuário
+        app_module.stream_limiter.max_per_user = 0
+    registry = app_module.llm_registry
+    registry.client_factory = lambda http_client, **kwargs: FakeChatModel(args.tokens, args.token_latency)
+    registry._clients.clear()
+    app = app_module.app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            credentials = {"username": "admin", "password": "admin123"}
+            response = await client.post("/login", json=credentials)
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            # Conversas fixas: o histórico cresce como em uso real
+            conversation_ids = []
+            for _ in range(args.concurrency):
+                response = await client.post("/chat", json={"message": "oi", "stream": False}, headers=headers)
+                conversation_ids.append(response.json()["conversation_id"])
+
+            def chat(stream: bool):
+                async def send(i):
+                    body = {
+                        "message": f"mensagem {i}",
+                        "conversation_id": conversation_ids[i % len(conversation_ids)],
+                        "stream": stream,
+                    }
+                    return await client.post("/chat", json=body, headers=headers)
+                return send
+
+            async def login(i):
+                return await client.post("/login", json=credentials)
+
+            async def conversations(i):
+                return await client.get("/conversations", headers=headers)
+
+            async def generate(i):
+                # Prompts distintos (sem cache) exceto com --cache-ratio
+                prompt = "repetido" if i % 100 < args.cache_ratio * 100 else f"prompt {i}"
+                return await client.post("/api/generate", json={"prompt": prompt}, headers=headers)
+
+            scenarios = {
+                "login": login,
+                "chat": chat(False),
+                "chat-stream": chat(True),
+                "conversations": conversations,
+                "generate": generate,
+            }
+            results = {}
+            for name in args.scenarios:
+                requests = args.login_requests if name == "login" else args.requests
+                rss_before = _rss_mb()
+                elapsed, latencies = await _run_scenario(scenarios[name], requests, args.concurrency)
+                p50, p95, p99 = _percentiles(latencies)
+                results[name] = {
+                    "requests": requests,
+                    "rps": round(requests / elapsed, 1),
+                    "p50_ms": round(p50 * 1000, 2),
+                    "p95_ms": round(p95 * 1000, 2),
+                    "p99_ms": round(p99 * 1000, 2),
+                    "memory_growth_mb": round(_rss_mb() - rss_before, 2),
+                }
+    return results
+
+
+def _compare(results, baseline, tolerance: float):
+    """
+    Lista as regressões em relação ao baseline: RPS menor ou p95/p99
+    maiores que a tolerância (fração).
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+        for metric in ("p95_ms", "p99_ms"):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+def bench_load(args) -> None:
+    """
+    Teste de carga das rotas da app via ASGI (sem rede e sem a OpenAI).
+    """
+    # Logs por requisição atrapalham a medição; erros continuam registrados
+    os.environ.setdefault("LOG_REQUEST_SAMPLE_RATE", "0")
+    results = asyncio.run(_load(args))
+
+    print(f"{'cenário':>14} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'memória MB':>11}")
+    for name, result in results.items():
+        print(f"{name:>14} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['memory_growth_mb']:>+11.2f}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = _compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSÃO {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"sem regressões em relação a {args.compare}")
+
+    if args.save:
+        settings = {
+            key: getattr(args, key)
+            for key in ("requests", "login_requests", "concurrency", "tokens", "token_latency", "cache_ratio")
+        }
+        with open(args.save, "w") as baseline_file:
+            json.dump({"settings": settings, "results": results}, baseline_file, indent=2)
+        print(f"baseline salvo em {args.save}")
+
+
+_STARTUP_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def run_lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        pass
+
+asyncio.run(run_lifespan())
+print(json.dumps({"import_s": imported - start, "lifespan_s": time.perf_counter() - imported}))
+"""
+
+
+def _parse_importtime(stderr: str):
+    """
+    Linhas de `-X importtime` -> [(módulo, próprio us, acumulado us)].
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if self_us.isdigit():
+            modules.append((name, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def bench_startup(args) -> None:
+    """
+    Mede o cold start em processos novos: import do main.py e o lifespan
+    (startup + shutdown), com os módulos mais caros do `-X importtime`.
+    """
+    env = {
+        "JWT_SECRET_KEY": "benchmark-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+        "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+        "OPENAI_API_KEY": "sk-benchmark",
+        **os.environ,
+    }
+    here = os.path.dirname(os.path.abspath(__file__))
+    imports, lifespans = [], []
+    for _ in range(args.repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _STARTUP_SCRIPT],
+            cwd=here, env=env, capture_output=True, text=True, check=True,
+        )
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        imports.append(timings["import_s"])
+        lifespans.append(timings["lifespan_s"])
+        modules = _parse_importtime(result.stderr)
+
+    print(f"import do main.py: {statistics.median(imports) * 1000:8.1f} ms (mediana de {args.repeat})")
+    print(f"lifespan:          {statistics.median(lifespans) * 1000:8.1f} ms")
+    print("\nmódulos mais caros (acumulado, última execução):")
+    # Só pacotes de topo: o acumulado do pai já inclui os submódulos
+    top_level = [module for module in modules if "." not in module[0]]
+    for name, _, cumulative_us in sorted(top_level, key=lambda module: -module[2])[:args.top]:
+        print(f"{cumulative_us / 1000:10.1f} ms  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    history = commands.add_parser("history", help="custo por turno da montagem do histórico")
+    history.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    history.add_argument("--max-tokens", type=int, default=3000)
+    history.add_argument("--repeat", type=int, default=200)
+    history.set_defaults(func=bench_history)
+
+    auth = commands.add_parser("auth", help="custo da verificação de JWT por requisição")
+    auth.add_argument("--repeat", type=int, default=5000)
+    auth.set_defaults(func=bench_auth)
+
+    middleware = commands.add_parser("middleware", help="pilha de middlewares antiga x ASGI pura")
+    middleware.add_argument("--requests", type=int, default=2000)
+    middleware.add_argument("--concurrency", type=int, default=50)
+    middleware.add_argument("--events", type=int, default=200)
+    middleware.set_defaults(func=bench_middleware)
+
+    load = commands.add_parser("load", help="carga nas rotas da app com um LLM fake")
+    load.add_argument("--scenarios", nargs="+", default=["login", "chat", "chat-stream", "conversations", "generate"],
+                      choices=["login", "chat", "chat-stream", "conversations", "generate"])
+    load.add_argument("--requests", type=int, default=500)
+    load.add_argument("--login-requests", type=int, default=20, help="o bcrypt é lento de propósito")
+    load.add_argument("--concurrency", type=int, default=20)
+    load.add_argument("--tokens", type=int, default=50, help="tokens por resposta do LLM fake")
+    load.add_argument("--token-latency", type=float, default=0.0, help="segundos por token do LLM fake")
+    load.add_argument("--cache-ratio", type=float, default=0.0, help="fração de prompts repetidos no generate")
+    load.add_argument("--rate-limit", action="store_true",
+                      help="mantém o rate limit e o limite de streams por usuário ativos")
+    load.add_argument("--save", metavar="ARQUIVO", help="salva os resultados como baseline (JSON)")
+    load.add_argument("--compare", metavar="ARQUIVO", help="compara com um baseline e sai com erro se regrediu")
+    load.add_argument("--tolerance", type=float, default=0.2, help="variação aceita em relação ao baseline")
+    load.set_defaults(func=bench_load)
+
+    startup = commands.add_parser("startup", help="tempo de import e lifespan do main.py")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--top", type=int, default=15)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Cache de respostas do LLM para o /api/generate e o /chat sem streaming.
+
+Camadas:
+- exata em memória (LRU), chave = (modelo, prompt normalizado, temperatura)
+- exata em disco (SQLite, opcional), com TTL; as consultas rodam em uma
+  thread dedicada, fora do event loop
+- semântica (opcional): reaproveita a resposta de um prompt cuja similaridade
+  de cosseno dos embeddings passe do limiar. Só para prompts independentes
+  (/api/generate): no /chat turnos seguidos da mesma conversa compartilham
+  quase todo o texto e um seria confundido com o outro
+
+O cache é só uma otimização: uma falha do embedding é registrada no log e
+tratada como falta (ou a resposta fica fora do índice semântico).
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import operator
+import re
+import sqlite3
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normaliza o prompt para a chave do cache (só os espaços: a caixa pode
+    mudar a resposta).
+    """
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def iter_chunks(text: str, size: int = 64) -> Iterator[str]:
+    """
+    Divide uma resposta em cache em pedaços para reenvio via SSE.
+    """
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def _unit_vector(vector: List[float]) -> array:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return array("f", (value / norm for value in vector))
+
+
+def _best_match(vector: array, candidates: List[Tuple[str, array]], threshold: float) -> Optional[str]:
+    """
+    Chave do candidato mais similar (produto escalar de vetores unitários)
+    com similaridade >= threshold, ou None.
+    """
+    best_key, best_score = None, threshold
+    for key, other_vector in candidates:
+        score = sum(map(operator.mul, vector, other_vector))
+        if score >= best_score:
+            best_key, best_score = key, score
+    return best_key
+
+
+class ResponseCache:
+    """
+    Cache de respostas em camadas.
+
+    Args:
+        max_entries: Quantidade máxima de respostas em memória
+        ttl_seconds: Validade de uma resposta (0 = sem expiração)
+        db_path: Arquivo SQLite da camada em disco (None = desativada)
+        embed: Função assíncrona texto -> embedding (None = sem modo semântico)
+        similarity_threshold: Similaridade mínima para reaproveitar uma resposta
+        max_semantic_entries: Tamanho do índice semântico (busca linear)
+        logger: Logger das falhas do embedding (padrão: o deste módulo)
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        db_path: Optional[str] = None,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        similarity_threshold: float = 0.95,
+        max_semantic_entries: int = 500,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self.logger = logger or logging.getLogger(__name__)
+        # chave -> (resposta, criado em)
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # chave -> (modelo, temperatura, vetor unitário)
+        self._semantic: "OrderedDict[str, Tuple[str, float, array]]" = OrderedDict()
+        # Embeddings recentes (get e set do mesmo prompt calculam só uma vez)
+        self._vectors: "OrderedDict[str, array]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # Uma única thread usa a conexão: as consultas não concorrem entre si
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="response-cache")
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float) -> str:
+        raw = f"{model}\x00{temperature}\x00{normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _vector(self, prompt: str) -> array:
+        text = normalize_prompt(prompt)
+        vector = self._vectors.get(text)
+        if vector is None:
+            vector = _unit_vector(await self.embed(text))
+            self._vectors[text] = vector
+            while len(self._vectors) > 128:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _read_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._db.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and self._expired(row[1]):
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        return row
+
+    def _write_disk(self, key: str, response: str, created_at: float) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, created_at),
+        )
+
+    async def _on_disk(self, method: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+
+    async def _lookup(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                return entry[0]
+            del self._memory[key]
+        if self._db is not None:
+            row = await self._on_disk(self._read_disk, key)
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                return row[0]
+        return None
+
+    async def get(self, model: str, prompt: str, temperature: float, semantic: bool = True) -> Optional[str]:
+        """
+        Retorna a resposta em cache para o prompt ou None.
+
+        Args:
+            semantic: Também procura prompts parecidos (False = só a chave exata)
+        """
+        key = self.make_key(model, prompt, temperature)
+        response = await self._lookup(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        if semantic and self.embed is not None and self._semantic:
+            try:
+                vector = await self._vector(prompt)
+            except Exception as exc:
+                self.logger.warning(f"Falha no embedding do cache semântico: {exc!r}")
+                self.misses += 1
+                return None
+            candidates = [
+                (other_key, other_vector)
+                for other_key, (other_model, other_temperature, other_vector) in self._semantic.items()
+                if other_model == model and other_temperature == temperature
+            ]
+            # Busca linear em Python (~50 ms com 500 vetores de 1536 dimensões):
+            # roda em uma thread para não travar os streams do event loop
+            best_key = await asyncio.to_thread(
+                _best_match, vector, candidates, self.similarity_threshold)
+            if best_key is not None:
+                response = await self._lookup(best_key)
+                if response is not None:
+                    self.semantic_hits += 1
+                    return response
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, prompt: str, temperature: float, response: str, semantic: bool = True) -> None:
+        """
+        Guarda a resposta completa do prompt (`semantic=False`: fora do índice semântico).
+        """
+        key = self.make_key(model, prompt, temperature)
+        created_at = time.time()
+        self._remember(key, response, created_at)
+        if self._db is not None:
+            await self._on_disk(self._write_disk, key, response, created_at)
+        if semantic and self.embed is not None:
+            try:
+                vector = await self._vector(prompt)
+            except Exception as exc:
+                self.logger.warning(f"Falha no embedding do cache semântico: {exc!r}")
+                return
+            self._semantic[key] = (model, temperature, vector)
+            self._semantic.move_to_end(key)
+            while len(self._semantic) > self.max_semantic_entries:
+                self._semantic.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,167 @@
+"""
+Janela de contexto do /chat com orçamento de tokens e resumo incremental.
+
+Somente as mensagens mais recentes que cabem em `max_tokens` são enviadas ao
+modelo. As mais antigas são condensadas em um resumo, que só é refeito quando
+a janela desliza. Para evitar um novo resumo a cada turno, a janela desliza
+até ocupar `slide_ratio` do orçamento.
+
+O início da janela e o resumo ficam no `ConversationStore`: outros workers e
+um restart continuam de onde a janela parou. As mensagens que saem da janela
+são resumidas em pedaços de até `summary_input_tokens`, nunca todas de uma vez.
+
+O resumo é gerado por qualquer objeto com `ainvoke(messages)` (ex.: ChatOpenAI
+ou o FakeListChatModel do langchain_core em testes). Com um `LLMScheduler`,
+cada chamada de resumo ocupa uma vaga INTERACTIVE do usuário da conversa.
+"""
+
+import asyncio
+import weakref
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from scheduler import INTERACTIVE, LLMScheduler
+from store import ConversationStore, approximate_tokens
+
+SUMMARY_PROMPT = (
+    "Resuma a conversa a seguir entre um usuário e um assistente em até 150 palavras, "
+    "mantendo fatos, decisões e pedidos em aberto. Responda apenas com o resumo."
+)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Conta tokens com o tiktoken (o200k_base, usado pelos modelos gpt-4o).
+    Se o tiktoken ou o arquivo de encoding não estiverem disponíveis, usa a
+    estimativa de ~4 caracteres por token.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return approximate_tokens(text)
+    # +4 tokens de formatação por mensagem (papel e separadores)
+    return len(_encoding.encode(text, disallowed_special=())) + 4
+
+
+class ContextWindow:
+    """
+    Monta o histórico enviado ao modelo para uma conversa.
+
+    Args:
+        store: Backend de conversas (fornece as contagens de tokens)
+        max_tokens: Orçamento de tokens do histórico
+        summary_llm: Modelo usado para resumir as mensagens que saem da janela
+            (None = descarta as mensagens antigas sem resumo)
+        slide_ratio: Fração do orçamento ocupada logo após a janela deslizar
+        summary_input_tokens: Tokens de mensagens por chamada de resumo
+            (padrão: `max_tokens`)
+        max_summary_calls: Chamadas de resumo por deslize; mensagens mais
+            antigas que isso saem da janela sem entrar no resumo
+        scheduler: Escalonador das chamadas ao LLM (None = chama direto)
+    """
+
+    def __init__(
+        self,
+        store: ConversationStore,
+        max_tokens: int = 3000,
+        summary_llm: Optional[Any] = None,
+        slide_ratio: float = 0.5,
+        summary_input_tokens: Optional[int] = None,
+        max_summary_calls: int = 4,
+        scheduler: Optional[LLMScheduler] = None,
+    ):
+        self.store = store
+        self.max_tokens = max_tokens
+        self.summary_llm = summary_llm
+        self.slide_ratio = slide_ratio
+        self.summary_input_tokens = summary_input_tokens or max_tokens
+        self.max_summary_calls = max_summary_calls
+        self.scheduler = scheduler
+        # Um lock por conversa em uso (somem quando ninguém mais os referencia)
+        self._locks: "weakref.WeakValueDictionary[tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    async def build(self, user_id: str, conversation_id: str) -> list:
+        """
+        Retorna as mensagens do LangChain a enviar ao modelo: o resumo das
+        mensagens antigas (se houver) seguido das mensagens da janela.
+        """
+        key = (user_id, conversation_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        store = self.store
+        # Evita dois resumos simultâneos da mesma conversa neste worker
+        async with lock:
+            start, summary = await store.run(store.get_context_state, user_id, conversation_id)
+            if await store.run(store.token_count, user_id, conversation_id, start) > self.max_tokens:
+                new_start = await store.run(
+                    store.window_start, user_id, conversation_id, int(self.max_tokens * self.slide_ratio))
+                if new_start > start:
+                    if self.summary_llm is not None:
+                        leaving = await store.run(
+                            store.get_messages, user_id, conversation_id, start, new_start - start)
+                        summary = await self._summarize_leaving(user_id, summary, leaving)
+                    start = new_start
+                    await store.run(store.set_context_state, user_id, conversation_id, start, summary)
+        window = await self.store.run(self.store.get_langchain_messages, user_id, conversation_id, start)
+        if summary:
+            from langchain_core.messages import SystemMessage
+
+            window.insert(0, SystemMessage(content=f"Resumo da conversa até aqui: {summary}"))
+        return window
+
+    async def _summarize_leaving(self, user_id: str, summary: Optional[str], messages: List[Dict]) -> Optional[str]:
+        """
+        Resume as mensagens que saem da janela em pedaços de até
+        `summary_input_tokens`, no máximo `max_summary_calls` chamadas (as
+        mensagens mais recentes têm prioridade).
+        """
+        budget = self.summary_input_tokens
+        # Monta os pedaços de trás para frente (mais recentes primeiro)
+        pieces: List[List[Dict]] = [[]]
+        piece_tokens = 0
+        for message in reversed(messages):
+            tokens = self.store.token_counter(message["content"])
+            if tokens > budget:
+                # Mensagem maior que um pedaço inteiro: entra só o começo (~4 caracteres/token)
+                message = {"role": message["role"], "content": message["content"][:budget * 4]}
+                tokens = budget
+            if pieces[-1] and piece_tokens + tokens > budget:
+                if len(pieces) == self.max_summary_calls:
+                    break
+                pieces.append([])
+                piece_tokens = 0
+            pieces[-1].insert(0, message)
+            piece_tokens += tokens
+        for piece in reversed(pieces):
+            if piece:
+                summary = await self._summarize(user_id, summary, piece)
+        return summary
+
+    async def _summarize(self, user_id: str, previous: Optional[str], messages: List[Dict]) -> str:
+        """
+        Atualiza o resumo anterior com as mensagens que saíram da janela.
+        """
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        lines = []
+        if previous:
+            lines.append(f"Resumo anterior: {previous}")
+        for message in messages:
+            role = "Usuário" if message["role"] == "user" else "Assistente"
+            lines.append(f"{role}: {message['content']}")
+        # O resumo faz parte do turno do /chat: mesma prioridade e mesmo usuário
+        slot = self.scheduler.slot(user_id, INTERACTIVE) if self.scheduler is not None else nullcontext()
+        async with slot:
+            response = await self.summary_llm.ainvoke([
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content="\n".join(lines)),
+            ])
+        return response.content
@@ -0,0 +1,250 @@
+"""
+Clientes LLM compartilhados do SimpleBot.
+
+Em vez de criar um ChatOpenAI (e um pool de conexões HTTP novo) a cada
+requisição, o `LLMClientRegistry` mantém um cliente por
+(modelo, temperatura, streaming), todos usando o mesmo `httpx.AsyncClient`
+com keep-alive e HTTP/2. O registro é aberto e fechado no lifespan da app.
+
+O `SingleFlight` junta requisições idênticas em andamento em uma única
+chamada ao provedor, distribuindo os pedaços para cada assinante.
+
+`map_as_completed` executa várias chamadas com concorrência limitada,
+entregando cada resultado assim que fica pronto.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+
+ClientKey = Tuple[str, float, bool]
+
+
+def default_client_factory(http_client: "httpx.AsyncClient", **kwargs: Any) -> Any:
+    """
+    Cria um ChatOpenAI usando o cliente HTTP compartilhado.
+    """
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(http_async_client=http_client, **kwargs)
+
+
+class LLMClientRegistry:
+    """
+    Registro de clientes LLM reaproveitados entre requisições.
+
+    Args:
+        client_factory: Função (http_client, model=, temperature=, streaming=)
+            que cria o cliente (trocável por um modelo fake em benchmarks)
+        max_connections: Conexões simultâneas no pool HTTP
+        max_keepalive_connections: Conexões ociosas mantidas abertas
+        keepalive_expiry: Tempo (s) até fechar uma conexão ociosa
+        http2: Usa HTTP/2 (requer o pacote h2)
+        timeout: Timeout (s) das requisições ao provedor
+        max_clients: Quantidade máxima de clientes mantidos (modelos distintos)
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[..., Any] = default_client_factory,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: float = 60.0,
+        max_clients: int = 32,
+    ):
+        self.client_factory = client_factory
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.timeout = timeout
+        self.max_clients = max_clients
+        self.http_client: Optional["httpx.AsyncClient"] = None
+        self._clients: "OrderedDict[ClientKey, Any]" = OrderedDict()
+
+    def start(self) -> None:
+        """
+        Abre o cliente HTTP compartilhado (chamado no startup da app).
+        """
+        if self.http_client is None:
+            # Importado aqui: o httpx só é necessário quando a app sobe de fato
+            import httpx
+
+            self.http_client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.timeout,
+            )
+
+    def get(self, model: str, temperature: float = 0.2, streaming: bool = False) -> Any:
+        """
+        Retorna o cliente de (model, temperature, streaming), criando se preciso.
+        """
+        key = (model, temperature, streaming)
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            return client
+        self.start()
+        client = self.client_factory(
+            self.http_client,
+            model=model,
+            temperature=temperature,
+            streaming=streaming,
+        )
+        self._clients[key] = client
+        while len(self._clients) > self.max_clients:
+            self._clients.popitem(last=False)
+        return client
+
+    async def aclose(self) -> None:
+        """
+        Descarta os clientes e fecha as conexões (chamado no shutdown da app).
+        """
+        self._clients.clear()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+
+# =============================================================================
+# Single-flight de streams
+# =============================================================================
+
+_DONE = object()
+
+
+class _Flight:
+    __slots__ = ("chunks", "subscribers", "task")
+
+    def __init__(self):
+        # Pedaços já recebidos (reenviados para quem assina no meio do stream)
+        self.chunks: List[str] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    Coalescência de streams idênticos em andamento.
+
+    A primeira requisição de uma chave inicia o stream do provedor em uma
+    task; as seguintes assinam o mesmo stream. Cada assinante tem uma fila
+    limitada: um assinante lento segura o produtor (backpressure) em vez de
+    acumular memória. Se todos os assinantes saírem, a chamada é cancelada.
+
+    Args:
+        queue_size: Tamanho da fila de cada assinante
+    """
+
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self._flights: Dict[str, _Flight] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    async def stream(self, key: str, upstream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Itera os pedaços do stream da chave, iniciando `upstream()` se ninguém
+        estiver buscando essa chave no momento.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._produce(key, flight, upstream))
+            self.upstream_calls += 1
+        else:
+            self.coalesced += 1
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        # Cópia e assinatura sem await entre elas: nenhum pedaço se perde
+        replay = list(flight.chunks)
+        flight.subscribers.add(queue)
+        try:
+            for chunk in replay:
+                yield chunk
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self._unsubscribe(key, flight, queue)
+
+    def _unsubscribe(self, key: str, flight: _Flight, queue: asyncio.Queue) -> None:
+        flight.subscribers.discard(queue)
+        # Esvazia a fila para liberar um put pendente do produtor
+        while not queue.empty():
+            queue.get_nowait()
+        if not flight.subscribers and flight.task is not None and not flight.task.done():
+            flight.task.cancel()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def _produce(self, key: str, flight: _Flight, upstream: Callable[[], AsyncIterator[str]]) -> None:
+        async def publish(item: Any) -> None:
+            for queue in list(flight.subscribers):
+                if queue in flight.subscribers:
+                    await queue.put(item)
+
+        try:
+            async for chunk in upstream():
+                flight.chunks.append(chunk)
+                await publish(chunk)
+            final: Any = _DONE
+        except Exception as exc:
+            final = exc
+        finally:
+            # Sai do mapa antes do aviso final: quem chegar depois inicia outro stream
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        await publish(final)
+
+
+# =============================================================================
+# Execução em lote
+# =============================================================================
+
+async def map_as_completed(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Sequence[Any],
+    concurrency: int = 8,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Aplica `func` a cada item com no máximo `concurrency` chamadas em
+    andamento e entrega (índice, resultado) na ordem em que terminam.
+
+    Erros de um item não interrompem os demais: a exceção é entregue no
+    lugar do resultado. Se o consumidor sair, as chamadas pendentes são
+    canceladas.
+    """
+    results: asyncio.Queue = asyncio.Queue()
+    indices = iter(range(len(items)))
+
+    async def worker() -> None:
+        for index in indices:
+            try:
+                result = await func(items[index])
+            except Exception as exc:
+                result = exc
+            results.put_nowait((index, result))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+    try:
+        for _ in range(len(items)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,144 @@
+"""
+Pipeline de logging estruturado do SimpleBot.
+
+O caminho da requisição só coloca o LogRecord em uma fila (QueueHandler).
+Uma thread (QueueListener) formata cada registro em JSON uma única vez
+(orjson) e escreve em lotes no stream, com flush periódico.
+"""
+
+import atexit
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, List, Optional
+
+import orjson
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Classe de formatação JSON para o log handler
+
+    Registros de `log_structured` trazem os campos prontos em `record.structured`;
+    os demais são montados a partir do próprio LogRecord.
+    """
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat()
+        structured = getattr(record, "structured", None)
+        if structured is not None:
+            log_data = {"timestamp": timestamp, **structured}
+        else:
+            log_data = {
+                "timestamp": timestamp,
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "module": record.module,
+                "function": record.funcName,
+                "line": record.lineno
+            }
+
+            # Adiciona campos extras
+            for field in ("user_id", "conversation_id", "path", "method"):
+                if hasattr(record, field):
+                    log_data[field] = getattr(record, field)
+            if record.exc_info:
+                log_data["exception"] = self.formatException(record.exc_info)
+
+        return orjson.dumps(log_data, default=str).decode()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que não formata no caminho da requisição e descarta
+    registros quando a fila está cheia (nunca bloqueia o event loop).
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Fila em memória no mesmo processo: o registro não precisa ser serializável
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """
+    Acumula as linhas formatadas e escreve em lote no stream.
+
+    Args:
+        stream: Destino (padrão: stderr)
+        batch_size: Linhas acumuladas antes de escrever
+    """
+
+    def __init__(self, stream: Optional[IO[str]] = None, batch_size: int = 100):
+        super().__init__(stream)
+        self.batch_size = batch_size
+        self._buffer: List[str] = []
+
+    def emit(self, record):
+        try:
+            self._buffer.append(self.format(record))
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._buffer:
+            lines, self._buffer = self._buffer, []
+            self.stream.write(self.terminator.join(lines) + self.terminator)
+        super().flush()
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener que descarrega os handlers quando a fila fica ociosa por
+    `flush_interval` segundos e ao parar.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler, flush_interval: float = 0.5):
+        super().__init__(log_queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+def setup_logging(
+    logger: logging.Logger,
+    batch_size: int = 100,
+    flush_interval: float = 0.5,
+    queue_size: int = 10_000,
+    stream: Optional[IO[str]] = None,
+) -> BatchingQueueListener:
+    """
+    Liga o logger à fila e inicia a thread de escrita (parada no exit).
+    """
+    log_queue: queue.Queue = queue.Queue(queue_size)
+    writer = BatchStreamHandler(stream or sys.stderr, batch_size=batch_size)
+    writer.setFormatter(JSONFormatter())
+    listener = BatchingQueueListener(log_queue, writer, flush_interval=flush_interval)
+    logger.addHandler(NonBlockingQueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
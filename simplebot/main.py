@@ -13,68 +13,217 @@ Regras:
 - Manter tempo total em 160min (ver checklist.md).
 """
 
-import os
-import uuid
+import asyncio
 import json
+import hashlib
 import time
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
-from typing import AsyncIterator, Dict, List, Literal, Optional
-
-from dotenv import load_dotenv
-
-# LangChain
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage
+from typing import AsyncIterator, Callable, Dict, List, Literal, Optional
 
 # Rate Limiter
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
+from limits import RateLimitItem, parse as parse_rate_limit
 
 # FastAPI
-from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.exceptions import RequestValidationError
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.status import HTTP_404_NOT_FOUND
 
 # Validação
 from pydantic import BaseModel, Field
 
-# JWT
-from jose import JWTError, jwt
+# Serialização JSON das respostas sem passar por modelos Pydantic
+import orjson
+
+# Configuração tipada (pydantic-settings)
+from settings import load_settings
+
+# LangChain, jose e bcrypt são importados sob demanda (ou no lifespan), não no
+# import do módulo: o worker sobe mais rápido
+
+# Logging estruturado assíncrono
+from logs import setup_logging
+
+# Middlewares ASGI (headers de segurança e log de requisições)
+from middleware import MetricsMiddleware, RequestLoggingMiddleware, SecurityHeadersMiddleware
+
+# Métricas no formato Prometheus
+from metrics import CONTENT_TYPE, RATE_BUCKETS, TTFT_BUCKETS, MetricsRegistry, track_stream
 
-# Hashing
-import bcrypt
+# Armazenamento de conversas e janela de contexto
+from store import ConversationPage, ConversationStore, create_conversation_store
+from context import ContextWindow, count_tokens
 
-load_dotenv()
+# Clientes LLM compartilhados e cache de respostas
+from llm import LLMClientRegistry, SingleFlight, map_as_completed
+from scheduler import BATCH, INTERACTIVE, PRIORITY_NAMES, STANDARD, LLMScheduler, QueueTimeout
+from cache import ResponseCache, iter_chunks
+from sse import DONE_EVENT, StreamLimiter, coalesce, guarded_stream, sse_event
+
+# Storages de rate limit compartilhados (registra os esquemas sqlite:// e batched+)
+from ratelimit import BatchedStorage
 
 # =============================================================================
 # Configuração
 # =============================================================================
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-if not JWT_SECRET_KEY:
-    raise Exception("Favor verificar a JWT_SECRET_KEY")
+# Lida e validada uma única vez: falha aqui se faltar algo obrigatório
+settings = load_settings()
+
+DEFAULT_MODEL = settings.default_model
+
+# Conversações (backend definido por CONVERSATION_STORE: memory | sqlite)
+conversation_store: ConversationStore = create_conversation_store(
+    settings.conversation_store,
+    path=settings.conversation_db_path,
+    max_conversations=settings.conversation_max,
+    ttl_seconds=settings.conversation_ttl_seconds,
+    max_bytes=settings.conversation_max_bytes,
+    token_counter=count_tokens,
+)
+
+# Janela de contexto do /chat: últimas CONTEXT_MAX_TOKENS de histórico, mensagens
+# mais antigas resumidas por CONTEXT_SUMMARY_MODEL ("none" desativa o resumo)
+CONTEXT_SUMMARY_MODEL = settings.context_summary_model or DEFAULT_MODEL
+
+# Clientes LLM: um por (modelo, temperatura, streaming), com pool HTTP compartilhado
+llm_registry = LLMClientRegistry(
+    max_connections=settings.llm_max_connections,
+    max_keepalive_connections=settings.llm_max_keepalive,
+    keepalive_expiry=settings.llm_keepalive_expiry,
+    http2=settings.llm_http2,
+    timeout=settings.llm_timeout,
+)
+
+# Toda chamada ao modelo passa pelo escalonador: no máximo LLM_MAX_CONCURRENT
+# simultâneas, fila justa por usuário e /chat antes de /api/generate e lotes
+llm_scheduler = LLMScheduler(
+    max_concurrent=settings.llm_max_concurrent,
+    queue_timeout=settings.llm_queue_timeout,
+    on_wait=lambda waited, priority: llm_queue_time.observe(waited, PRIORITY_NAMES[priority]),
+)
+
+# Janela (ms) para agrupar tokens pequenos em um único evento SSE (0 = desativa)
+SSE_COALESCE_SECONDS = settings.sse_coalesce_ms / 1000
+
+# Streams SSE: buffer limitado, heartbeat em streams ociosos, cancelamento quando o
+# cliente desconecta e limite de streams simultâneos por usuário (0 = sem limite)
+stream_limiter = StreamLimiter(max_per_user=settings.max_streams_per_user)
+
+
+def reserve_stream(user_id: str) -> Callable[[], None]:
+    """
+    Reserva uma vaga de stream do usuário (429 se já está no limite).
+    """
+    release = stream_limiter.acquire(user_id)
+    if release is None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Limite de {stream_limiter.max_per_user} streams simultâneos atingido",
+        )
+    return release
+
+
+def stream_response(
+    request: Request,
+    events: AsyncIterator,
+    release: Callable[[], None],
+    media_type: str = "text/event-stream",
+    heartbeat: bool = True,
+) -> StreamingResponse:
+    """
+    Resposta em stream protegida; a vaga reservada é liberada quando o stream acaba.
+    O heartbeat é um comentário SSE (desligue para outros formatos, ex.: NDJSON).
+    """
+    guarded = guarded_stream(
+        events,
+        request.is_disconnected,
+        heartbeat_interval=settings.sse_heartbeat_seconds if heartbeat else float("inf"),
+        buffer_size=settings.sse_buffer_size,
+        check_interval=settings.sse_disconnect_check_seconds,
+    )
+    return StreamingResponse(stream_limiter.wrap(guarded, release), media_type=media_type)
+
+
+# Requisições idênticas simultâneas do /api/generate compartilham um único stream
+single_flight = SingleFlight(queue_size=settings.llm_single_flight_queue)
 
-JWT_ALGORITHM = os.getenv("ALGORITHM")
-if not JWT_ALGORITHM:
-    raise Exception("Favor verificar o JWT_ALGORITHM")
+# Cache de respostas do /api/generate e do /chat sem streaming
+RESPONSE_CACHE_ENABLED = settings.response_cache
+# Modelo de embedding do modo semântico (vazio = somente correspondência exata)
+RESPONSE_CACHE_SEMANTIC_MODEL = settings.response_cache_semantic_model
 
-ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
-if not ACCESS_TOKEN_EXPIRE_MINUTES:
-    raise Exception("Favor verificar o ACCESS_TOKEN_EXPIRE_MINUTES")
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    db_path=settings.response_cache_db_path or None,
+    similarity_threshold=settings.response_cache_similarity,
+)
+
+# O modelo de resumo é definido no startup (ver lifespan); os resumos passam
+# pelo escalonador como chamadas do /chat
+context_window = ContextWindow(
+    conversation_store,
+    max_tokens=settings.context_max_tokens,
+    slide_ratio=settings.context_slide_ratio,
+    scheduler=llm_scheduler,
+)
+
+
+def warm_up() -> None:
+    """
+    Importa as dependências carregadas sob demanda e o tokenizer.
+    """
+    import bcrypt  # noqa: F401
+    import jose.jwt  # noqa: F401
+    import langchain_core.messages  # noqa: F401
 
-REFRESH_TOKEN_EXPIRE_DAYS = os.getenv("REFRESH_TOKEN_EXPIRE_DAYS")
-if not REFRESH_TOKEN_EXPIRE_DAYS:
-    raise Exception("Favor verificar o REFRESH_TOKEN_EXPIRE_DAYS")
+    count_tokens("")
 
-DEFAULT_MODEL = "gpt-4o-mini"
 
-# Conversações
-conversations: Dict[str, Dict[str, List[Dict]]] = {}
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: carrega usuários, cria o pool do bcrypt, aquece os imports sob
+    demanda e abre os clientes LLM. Shutdown: fecha conexões e backends.
+    """
+    global user_store, password_executor
+    user_store = UserStore.from_file(settings.users_file)
+    password_executor = ThreadPoolExecutor(
+        max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+    # Trabalho único de startup fora do event loop: a primeira requisição não paga por ele
+    await asyncio.to_thread(warm_up)
+    llm_registry.start()
+    # Pré-cria os clientes mais usados
+    llm_registry.get(DEFAULT_MODEL, temperature=0.2, streaming=True)
+    llm_registry.get(DEFAULT_MODEL, temperature=0.2, streaming=False)
+    if CONTEXT_SUMMARY_MODEL != "none":
+        context_window.summary_llm = llm_registry.get(CONTEXT_SUMMARY_MODEL, temperature=0)
+    if RESPONSE_CACHE_SEMANTIC_MODEL:
+        # Falhas do embedding vão para o log estruturado da API
+        response_cache.logger = logger
+        from langchain_openai import OpenAIEmbeddings
+        response_cache.embed = OpenAIEmbeddings(
+            model=RESPONSE_CACHE_SEMANTIC_MODEL,
+            http_async_client=llm_registry.http_client,
+        ).aembed_query
+    yield
+    # Envia as batidas locais ainda não sincronizadas do rate limit
+    if isinstance(limiter.limiter.storage, BatchedStorage):
+        limiter.limiter.storage.flush()
+    await llm_registry.aclose()
+    conversation_store.close()
+    response_cache.close()
+    password_executor.shutdown(wait=False)
+
 
 app = FastAPI(
     title="Chatbot",
@@ -84,7 +233,8 @@ app = FastAPI(
         "name": "Renato Saldanha",
         "email": "ranalisesaldanha@gmail.com",
     },
-    license_info={"name": "MIT"}
+    license_info={"name": "MIT"},
+    lifespan=lifespan,
 )
 
 # =============================================================================
@@ -92,36 +242,22 @@ app = FastAPI(
 # =============================================================================
 
 
-class JSONFormatter(logging.Formatter):
-    """
-    Classe de formatação JSON para o log handler
-    """
-
-    def format(self, record):
-        log_data = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "level": record.levelname,
-            "message": record.getMessage(),
-            "module": record.module,
-            "function": record.funcName,
-            "line": record.lineno
-        }
-
-        # Adiciona campos extras
-        if hasattr(record, "user_id"):
-            log_data["user_id"] = record.user_id
-        if hasattr(record, "conversation_id"):
-            log_data["conversation_id"] = record.conversation_id
-
-        return json.dumps(log_data)
-
-
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-handler = logging.StreamHandler()
-handler.setFormatter(JSONFormatter())
-logger.addHandler(handler)
+# Escrita assíncrona: o request só enfileira; uma thread formata e grava em lotes
+log_listener = setup_logging(
+    logger,
+    batch_size=settings.log_batch_size,
+    flush_interval=settings.log_flush_interval,
+    queue_size=settings.log_queue_size,
+)
+
+LOG_LEVELS = {
+    "ERROR": logging.ERROR,
+    "WARNING": logging.WARNING,
+    "INFO": logging.INFO,
+}
 
 
 def log_structured(level: str, message: str, **kwargs):
@@ -133,25 +269,18 @@ def log_structured(level: str, message: str, **kwargs):
         message: Mensagem do log
         **kwargs: Campos extras para incluir no log
     """
-    # Define o log
+    # Verifica o nível do log
+    levelno = LOG_LEVELS.get(level)
+    if levelno is None or not logger.isEnabledFor(levelno):
+        return
+
+    # Define o log (serializado uma única vez pelo JSONFormatter, fora do request)
     log_data = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
         "level": level,
         "message": message,
         **kwargs,
     }
-
-    # Converte em string JSON
-    log_json = json.dumps(log_data)
-
-    # Verifica o nível do log
-    match level:
-        case "ERROR":
-            logger.error(log_json)
-        case "WARNING":
-            logger.warning(log_json)
-        case "INFO":
-            logger.info(log_json)
+    logger.log(levelno, message, extra={"structured": log_data})
 
 
 ALLOWED_ORIGINS = [
@@ -167,45 +296,101 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Sem isso o navegador esconde o cursor de paginação do frontend
+    expose_headers=["X-Next-Cursor"],
 )
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-
-        # Content Security Policy (ajustado para permitir Swagger UI)
-        # Para rotas de documentação (/docs, /redoc, /openapi.json), permite CDNs necessários
-        if request.url.path in ["/docs", "/redoc", "/openapi.json"]:
-            # CSP mais permissivo para Swagger UI (permite CDNs e scripts inline)
-            csp = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net https://unpkg.com; "
-                "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://fonts.googleapis.com; "
-                "font-src 'self' https://fonts.gstatic.com; "
-                "img-src 'self' data: https:; "
-                "connect-src 'self'"
-            )
-        else:
-            # CSP restritivo para rotas da API
-            csp = "default-src 'self'"
-
-        response.headers["Content-Security-Policy"] = csp
+app.add_middleware(SecurityHeadersMiddleware)
 
-        # Strict Transport Security (força HTTPS)
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        # Referrer Policy (controla informações enviadas)
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        # Permissions Policy (controla features do navegador)
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=()"
 
-        return response
+# =============================================================================
+# Métricas (expostas em /metrics)
+# =============================================================================
 
+metrics = MetricsRegistry()
+http_request_duration = metrics.histogram(
+    "simplebot_http_request_duration_seconds",
+    "Duração das requisições HTTP até o fim do corpo",
+    ("method", "route", "status"),
+)
+http_requests_in_flight = metrics.gauge(
+    "simplebot_http_requests_in_flight",
+    "Requisições HTTP em andamento",
+)
+llm_time_to_first_token = metrics.histogram(
+    "simplebot_llm_time_to_first_token_seconds",
+    "Tempo até o primeiro token do LLM",
+    ("endpoint", "model"),
+    buckets=TTFT_BUCKETS,
+)
+llm_tokens_per_second = metrics.histogram(
+    "simplebot_llm_tokens_per_second",
+    "Tokens por segundo gerados pelo LLM",
+    ("endpoint", "model"),
+    buckets=RATE_BUCKETS,
+)
+llm_queue_time = metrics.histogram(
+    "simplebot_llm_queue_seconds",
+    "Espera na fila do escalonador antes de chamar o LLM",
+    ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+metrics.callback(
+    "simplebot_llm_queue_depth",
+    "Chamadas ao LLM esperando vaga",
+    lambda: [((name,), llm_scheduler.queue_depth(priority)) for priority, name in enumerate(PRIORITY_NAMES)],
+    ("priority",),
+)
+metrics.callback(
+    "simplebot_llm_active_calls",
+    "Chamadas ao LLM em andamento",
+    lambda: [((), llm_scheduler.active)],
+)
+rate_limit_rejections = metrics.counter(
+    "simplebot_rate_limit_rejections_total",
+    "Requisições recusadas pelo rate limit",
+    ("route",),
+)
+# Contadores que já existem nos caches: lidos só na coleta
+metrics.callback(
+    "simplebot_cache_lookups_total",
+    "Consultas aos caches por resultado",
+    lambda: [
+        (("response", "hit"), response_cache.hits),
+        (("response", "semantic_hit"), response_cache.semantic_hits),
+        (("response", "miss"), response_cache.misses),
+        (("jwt", "hit"), token_cache.hits),
+        (("jwt", "miss"), token_cache.misses),
+    ],
+    ("cache", "result"),
+    metric_type="counter",
+)
+metrics.callback(
+    "simplebot_cache_hit_ratio",
+    "Fração das consultas respondidas pelo cache",
+    lambda: [
+        (("response",), response_cache.stats()["hit_ratio"]),
+        (("jwt",), token_cache.hit_ratio()),
+    ],
+    ("cache",),
+)
+metrics.callback(
+    "simplebot_single_flight_requests_total",
+    "Streams do /api/generate por origem (chamada ao provedor ou coalescido)",
+    lambda: [
+        (("upstream",), single_flight.upstream_calls),
+        (("coalesced",), single_flight.coalesced),
+    ],
+    ("source",),
+    metric_type="counter",
+)
 
-app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(
+    MetricsMiddleware,
+    duration=http_request_duration,
+    in_flight=http_requests_in_flight,
+)
 
 
 # =============================================================================
@@ -226,12 +411,8 @@ def get_user_id_for_rate_limit(request: Request) -> str:
 
     token = auth_header.split(" ")[1]
     try:
-        # Decodifica JWT (sem verificar assinatura completa, apenas para extrair user_id)
-        payload = jwt.decode(
-            token,
-            JWT_SECRET_KEY,
-            algorithms=[JWT_ALGORITHM]
-        )
+        # Decodifica JWT (reaproveita a verificação em cache do get_current_user)
+        payload = decode_token(token)
         user_id = payload.get("sub")
 
         return user_id or get_remote_address(request)
@@ -240,9 +421,50 @@ def get_user_id_for_rate_limit(request: Request) -> str:
         return get_remote_address(request)
 
 
-limiter = Limiter(key_func=get_user_id_for_rate_limit)
+# Storage do rate limit: "memory://" conta por worker; com vários workers use
+# "sqlite:///ratelimit.db" (mesma máquina) ou "redis://..." e, na frente dele,
+# "batched+<uri>" para sincronizar as batidas em lotes
+RATE_LIMIT_STORAGE_URI = settings.rate_limit_storage_uri
+rate_limit_storage_options = {}
+if RATE_LIMIT_STORAGE_URI.startswith("batched+"):
+    rate_limit_storage_options = {
+        "sync_every": settings.rate_limit_sync_every,
+        "sync_interval": settings.rate_limit_sync_interval,
+    }
+
+limiter = Limiter(
+    key_func=get_user_id_for_rate_limit,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    storage_options=rate_limit_storage_options,
+)
 app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """
+    Conta a recusa nas métricas e responde 429 pelo handler do slowapi.
+    """
+    route = request.scope.get("route")
+    rate_limit_rejections.inc(getattr(route, "path", request.url.path))
+    return _rate_limit_exceeded_handler(request, exc)
+
+
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+
+
+def charge_rate_limit(request: Request, item: RateLimitItem, route: str, cost: int = 1) -> None:
+    """
+    Conta uma requisição com peso `cost` no storage do limiter (o decorator
+    do slowapi só conhece o peso antes de ler o corpo). 429 se estourar.
+    """
+    if not limiter.enabled:
+        return
+    if not limiter.limiter.hit(item, get_user_id_for_rate_limit(request), route, cost=cost):
+        rate_limit_rejections.inc(route)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit excedido: {item}",
+        )
 
 
 # =============================================================================
@@ -293,6 +515,32 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     )
 
 
+@app.exception_handler(QueueTimeout)
+async def queue_timeout_handler(request: Request, exc: QueueTimeout):
+    """
+    Trata o excesso de espera na fila do escalonador do LLM.
+    """
+
+    logger.warning(
+        f"Fila do LLM: {exc}",
+        extra={
+            "path": str(request.url.path),
+            "method": request.method,
+        }
+    )
+
+    return JSONResponse(
+        status_code=503,
+        content={
+            "error": True,
+            "message": "Serviço sobrecarregado, tente novamente",
+            "status_code": 503,
+            "path": str(request.url.path),
+        },
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """
@@ -323,46 +571,92 @@ async def general_exception_handler(request: Request, exc: Exception):
 # Middleware de Request Logging
 # =============================================================================
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# Fração das requisições bem-sucedidas registradas (erros >= 400 sempre são)
+LOG_REQUEST_SAMPLE_RATE = settings.log_request_sample_rate
+
+app.add_middleware(
+    RequestLoggingMiddleware,
+    log=log_structured,
+    sample_rate=LOG_REQUEST_SAMPLE_RATE,
+)
+
 
-        start_time = time.time()
+# =============================================================================
+# Autenticação (herdado do Dia 4)
+# =============================================================================
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-        # Processa a requisição
-        response = await call_next(request)
 
-        duration = time.time() - start_time
+class TokenCache:
+    """
+    Cache de payloads de JWT já verificados, chaveado pelo hash do token.
+    Cada entrada vale até o `exp` do próprio token.
 
-        # Efetua log estruturado
-        log_structured(
-            "INFO",
-            "Request processada",
-            method=request.method,
-            path=str(request.url.path),
-            status_code=response.status_code,
-            duration_ms=round(duration * 1000, 2),
-            client_ip=request.client.host if request.client else None
-        )
+    Args:
+        max_entries: Quantidade máxima de tokens mantidos
+    """
 
-        return response
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        payload = self._entries.get(key)
+        if payload is None:
+            self.misses += 1
+            return None
+        if payload.get("exp", 0) <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return payload
 
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return round(self.hits / lookups, 4) if lookups else 0.0
 
-app.add_middleware(RequestLoggingMiddleware)
+    def set(self, token: str, payload: dict) -> None:
+        if "exp" not in payload:
+            return
+        self._entries[self._key(token)] = payload
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
 
 
-# =============================================================================
-# Autenticação (herdado do Dia 4)
-# =============================================================================
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+token_cache = TokenCache(max_entries=settings.jwt_cache_size)
 
 
-def verify_token(token: str, expected_type: str = "access") -> dict:
-    try:
+def decode_token(token: str) -> dict:
+    """
+    Decodifica e verifica o JWT, consultando antes o cache de tokens verificados.
+    Lança JWTError para tokens inválidos ou expirados.
+    """
+    payload = token_cache.get(token)
+    if payload is None:
+        from jose import jwt
+
         payload = jwt.decode(
             token,
-            JWT_SECRET_KEY,
-            algorithms=[JWT_ALGORITHM]
+            settings.jwt_secret_key,
+            algorithms=[settings.algorithm]
         )
+        token_cache.set(token, payload)
+    return payload
+
+
+def verify_token(token: str, expected_type: str = "access") -> dict:
+    from jose import JWTError
+
+    try:
+        payload = decode_token(token)
         token_type = payload.get("type")
         if token_type != expected_type:
             raise HTTPException(
@@ -412,6 +706,8 @@ class ConversationSummary(BaseModel):
     id: str = Field(..., description="ID da conversação",
                     example="11k33h1jjf0591994df-4e93-4902-b04a-7424ebcf05bf")
     created_at: str = Field(..., description="Data de criação")
+    updated_at: Optional[str] = Field(
+        default=None, description="Data da última mensagem")
     last_message: Optional[str] = Field(
         default=None, description="Última mensagem")
     message_count: int = Field(...,
@@ -447,57 +743,58 @@ class GenerateRequest(BaseModel):
     model: Optional[str] = Field(default=None, description="Modelo usado")
 
 
+class GenerateBatchRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, description="Prompts processados em lote")
+    model: Optional[str] = Field(default=None, description="Modelo usado")
+
+
 # =============================================================================
 # Funções auxiliares de histórico (herdado do Dia 4)
 # =============================================================================
-def get_or_create_conversation(user_id: str, conversation_id: Optional[str] = None) -> str:
-    if user_id not in conversations:
-        conversations[user_id] = {}
-    if conversation_id and conversation_id in conversations[user_id]:
-        return conversation_id
-    new_id = str(uuid.uuid4())
-    conversations[user_id][new_id] = []
-    return new_id
-
-
-def add_message(user_id: str, conversation_id: str, role: str, content: str) -> None:
-    if user_id not in conversations:
-        conversations[user_id] = {}
-    if conversation_id not in conversations[user_id]:
-        conversations[user_id][conversation_id] = []
-    message = {
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    conversations[user_id][conversation_id].append(message)
-
-
-def get_messages(user_id: str, conversation_id: str) -> List[Dict]:
-    if user_id not in conversations:
-        return []
-    if conversation_id not in conversations[user_id]:
-        return []
-    return conversations[user_id][conversation_id].copy()
-
-
-def list_conversations(user_id: str) -> List[Dict]:
-    if user_id not in conversations:
-        return []
-    result = []
-    for conversation_id, messages in conversations[user_id].items():
-        created_at = messages[0].get("timestamp", datetime.now(
-            timezone.utc).isoformat()) if messages else None
-        last_message = messages[-1].get("content") if messages else None
-        message_count = len(messages)
-        result.append({
-            "id": conversation_id,
-            "created_at": created_at,
-            "last_message": last_message,
-            "message_count": message_count,
-        })
-    result.sort(key=lambda x: x["created_at"], reverse=True)
-    return result
+# O backend pode bloquear (SQLite): as chamadas passam por conversation_store.run
+async def get_or_create_conversation(user_id: str, conversation_id: Optional[str] = None) -> str:
+    return await conversation_store.run(
+        conversation_store.get_or_create_conversation, user_id, conversation_id)
+
+
+async def add_message(user_id: str, conversation_id: str, role: str, content: str) -> None:
+    await conversation_store.run(conversation_store.add_message, user_id, conversation_id, role, content)
+
+
+async def has_conversation(user_id: str, conversation_id: str) -> bool:
+    return await conversation_store.run(conversation_store.has_conversation, user_id, conversation_id)
+
+
+async def get_messages(
+    user_id: str,
+    conversation_id: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    before: Optional[datetime] = None,
+) -> List[Dict]:
+    return await conversation_store.run(
+        conversation_store.get_messages, user_id, conversation_id, offset, limit, before)
+
+
+async def list_conversations(user_id: str, cursor: Optional[str] = None, limit: Optional[int] = None) -> ConversationPage:
+    return await conversation_store.run(conversation_store.list_conversations, user_id, cursor, limit)
+
+
+async def invoke_model(model_name: str, messages: list, endpoint: str, user_id: str, priority: int) -> str:
+    """
+    Chamada sem streaming ao modelo (cliente compartilhado), passando pelo
+    escalonador e com as métricas de tempo.
+    """
+    model = llm_registry.get(model_name, temperature=0.2, streaming=False)
+    async with llm_scheduler.slot(user_id, priority):
+        started_at = time.perf_counter()
+        ai_response = await model.ainvoke(messages)
+    # Sem streaming o primeiro token chega junto com a resposta inteira
+    elapsed = time.perf_counter() - started_at
+    llm_time_to_first_token.observe(elapsed, endpoint, model_name)
+    if elapsed > 0:
+        llm_tokens_per_second.observe(count_tokens(ai_response.content) / elapsed, endpoint, model_name)
+    return ai_response.content
 
 
 # =============================================================================
@@ -512,35 +809,82 @@ def list_conversations(user_id: str) -> List[Dict]:
 # =============================================================================
 # Endpoints de Autenticação (herdado do Dia 4)
 # =============================================================================
+# Hash bcrypt pré-calculado de "admin123" (evita gerar o hash no import)
 FAKE_USER = {
     "username": "admin",
-    "hashed_password": bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt()).decode('utf-8'),
+    "hashed_password": "$2b$12$n5lrRYlvBkoiELol1/O9geqUkqahSlhgWqa87yHKENQOzh8IgYd1y",
 }
 
 
+class UserStore:
+    """
+    Fonte de credenciais: username -> hash bcrypt.
+
+    Por padrão contém apenas o FAKE_USER. Com USERS_FILE, carrega um JSON no
+    formato {"username": "hash bcrypt"} gerado previamente.
+    """
+
+    def __init__(self, users: Dict[str, str]):
+        self._users = users
+
+    @classmethod
+    def from_file(cls, users_file: Optional[str] = None) -> "UserStore":
+        if not users_file:
+            return cls({FAKE_USER["username"]: FAKE_USER["hashed_password"]})
+        with open(users_file, encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def get_hashed_password(self, username: str) -> Optional[str]:
+        return self._users.get(username)
+
+
+# Carregado no startup (ver lifespan)
+user_store = UserStore({})
+
+# bcrypt roda fora do event loop, em um pool limitado: uma rajada de logins
+# espera na fila em vez de travar os streams do mesmo worker (criado no lifespan)
+password_executor: Optional[ThreadPoolExecutor] = None
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    import bcrypt
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        password_executor,
+        bcrypt.checkpw,
+        password.encode('utf-8'),
+        hashed_password.encode('utf-8'),
+    )
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + \
-            timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
+            timedelta(minutes=settings.access_token_expire_minutes)
     to_encode.update({
         "exp": expire,
         "type": "access"
     })
     encoded_jwt = jwt.encode(
         to_encode,
-        JWT_SECRET_KEY,
-        algorithm=JWT_ALGORITHM,
+        settings.jwt_secret_key,
+        algorithm=settings.algorithm,
     )
     return encoded_jwt
 
 
 def create_refresh_token(data: dict) -> str:
+    from jose import jwt
+
     to_encode = data.copy()
     time_utc = datetime.now(timezone.utc)
-    time_delta = timedelta(days=int(REFRESH_TOKEN_EXPIRE_DAYS))
+    time_delta = timedelta(days=settings.refresh_token_expire_days)
     expire = time_utc + time_delta
     to_encode.update({
         "exp": expire,
@@ -548,8 +892,8 @@ def create_refresh_token(data: dict) -> str:
     })
     encoded_jwt = jwt.encode(
         to_encode,
-        JWT_SECRET_KEY,
-        algorithm=JWT_ALGORITHM)
+        settings.jwt_secret_key,
+        algorithm=settings.algorithm)
     return encoded_jwt
 
 
@@ -573,12 +917,13 @@ async def login(
 
     - `429` Limite de requisições excedido
     """
-    if login_data.username != FAKE_USER["username"]:
+    hashed_password = user_store.get_hashed_password(login_data.username)
+    if hashed_password is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário inválido."
         )
-    if not bcrypt.checkpw(login_data.password.encode('utf-8'), FAKE_USER["hashed_password"].encode('utf-8')):
+    if not await verify_password(login_data.password, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Senha inválida."
@@ -626,57 +971,67 @@ async def chat(
     """
     model_name = chat_request.model or DEFAULT_MODEL
     user_id = current_user["username"]
-    conversation_id = get_or_create_conversation(
-        user_id, chat_request.conversation_id)
-
-    log_structured(
-        "INFO",
-        "Inicio de chat",
-        user_id=user_id,
-        conversation_id=conversation_id,
-        model=model_name,
-    )
+    # Reserva a vaga antes de gravar a mensagem: um 429 não altera a conversa
+    release_stream = reserve_stream(user_id) if chat_request.stream else None
+    conversation_id = chat_request.conversation_id
 
+    # Tudo depois da reserva fica no try: um erro (ex.: lock do SQLite) libera a vaga
     try:
-        messages = get_messages(user_id, conversation_id)
-        langchain_messages = []
-        for message in messages:
-            if message["role"] == "user":
-                langchain_messages.append(
-                    HumanMessage(content=message["content"]))
-            if message["role"] == "assistant":
-                langchain_messages.append(
-                    AIMessage(content=message["content"]))
-
-        user_message = HumanMessage(content=chat_request.message)
-        langchain_messages.append(user_message)
-        add_message(user_id, conversation_id, "user", chat_request.message)
+        conversation_id = await get_or_create_conversation(user_id, conversation_id)
+
+        log_structured(
+            "INFO",
+            "Inicio de chat",
+            user_id=user_id,
+            conversation_id=conversation_id,
+            model=model_name,
+        )
+
+        await add_message(user_id, conversation_id, "user", chat_request.message)
+        langchain_messages = await context_window.build(user_id, conversation_id)
 
         if chat_request.stream:
-            async def generate():
-                model = ChatOpenAI(
-                    model=model_name,
-                    temperature=0.2,
-                    streaming=True,
-                )
-                response = ""
+            model = llm_registry.get(model_name, temperature=0.2, streaming=True)
+
+            async def contents():
                 async for chunk in model.astream(langchain_messages):
                     if chunk.content:
-                        response += chunk.content
-                        yield f"data: {chunk.content}\n\n"
-                yield "data: [DONE]\n\n"
-                add_message(user_id, conversation_id, "assistant", response)
-            return StreamingResponse(generate(), media_type="text/event-stream")
+                        yield chunk.content
+
+            # A vaga do escalonador vem antes da medição: a fila não conta no TTFT
+            tokens = llm_scheduler.stream(user_id, INTERACTIVE, track_stream(
+                contents(), llm_time_to_first_token, llm_tokens_per_second, "/chat", model_name))
+
+            async def generate():
+                chunks = []
+                try:
+                    async for piece in coalesce(tokens, SSE_COALESCE_SECONDS):
+                        chunks.append(piece)
+                        yield sse_event(piece)
+                    yield DONE_EVENT
+                finally:
+                    # Persiste também a resposta parcial se o cliente desconectar
+                    if chunks:
+                        # shield: um segundo cancelamento não perde a resposta
+                        await asyncio.shield(add_message(
+                            user_id, conversation_id, "assistant", "".join(chunks)))
+            return stream_response(request, generate(), release_stream)
         else:
-            model = ChatOpenAI(
-                model=model_name,
-                temperature=0.2,
-                streaming=False,
-            )
-            ai_response = await model.ainvoke(langchain_messages)
-            response_content = ai_response.content
-            add_message(user_id, conversation_id,
-                        "assistant", response_content)
+            # Histórico enviado ao modelo serializado como chave do cache. Só a
+            # chave exata: turnos seguidos são quase iguais e o modo semântico
+            # devolveria a resposta do turno anterior
+            prompt = "\n".join(
+                f"{message.type}: {message.content}" for message in langchain_messages)
+            response_content = None
+            if RESPONSE_CACHE_ENABLED:
+                response_content = await response_cache.get(model_name, prompt, 0.2, semantic=False)
+            if response_content is None:
+                response_content = await invoke_model(
+                    model_name, langchain_messages, "/chat", user_id, INTERACTIVE)
+                if RESPONSE_CACHE_ENABLED:
+                    await response_cache.set(model_name, prompt, 0.2, response_content, semantic=False)
+            await add_message(user_id, conversation_id,
+                              "assistant", response_content)
             return {
                 "reply": response_content,
                 "conversation_id": conversation_id,
@@ -684,6 +1039,8 @@ async def chat(
                 "model": model_name,
             }
     except Exception as exc:
+        if release_stream is not None:
+            release_stream()
         log_structured(
             "ERROR",
             "Erro ao processar chat",
@@ -696,26 +1053,34 @@ async def chat(
 
 @app.get("/conversations", response_model=List[ConversationSummary], tags=["Chat"])
 async def list_user_conversations(
+    response: Response,
+    cursor: Optional[str] = Query(
+        default=None, description="Cursor retornado no header X-Next-Cursor"),
+    limit: int = Query(default=50, ge=1, le=200,
+                       description="Quantidade máxima de conversas"),
     current_user: dict = Depends(get_current_user),
 ):
     """
-    Retorna uma lista de conversas com base no user_id
+    Retorna uma lista de conversas com base no user_id, da mais recente para a mais antiga
+
+    Paginação: quando houver mais conversas, o header `X-Next-Cursor` traz o
+    cursor a ser enviado na próxima chamada.
     """
     user_id = current_user["username"]
-    conversations_list = list_conversations(user_id)
-    return [
-        ConversationSummary(
-            id=conv["id"],
-            created_at=conv["created_at"],
-            last_message=conv["last_message"],
-            message_count=conv["message_count"],
-        ) for conv in conversations_list
-    ]
+    conversations_list, next_cursor = await list_conversations(user_id, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return conversations_list
 
 
 @app.get("/conversations/{conversation_id}/messages", response_model=List[Message], tags=["Chat"])
 async def get_conversation_messages(
     conversation_id: str,
+    offset: int = Query(default=0, ge=0, description="Posição da primeira mensagem"),
+    limit: Optional[int] = Query(
+        default=None, ge=1, le=1000, description="Quantidade máxima de mensagens"),
+    before: Optional[datetime] = Query(
+        default=None, description="Apenas mensagens anteriores a este instante (ISO 8601; sem fuso = UTC)"),
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -728,59 +1093,162 @@ async def get_conversation_messages(
     ou
 
     `404` Not Found para conversas não encontradas
-    
 
+    Paginação: `offset`/`limit` a partir do início, ou `before` + `limit`
+    para carregar as mensagens mais antigas que um timestamp.
     """
     user_id = current_user["username"]
-    if user_id not in conversations:
+    if not await has_conversation(user_id, conversation_id):
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND,
             detail="Conversa não encontrada"
         )
-    if conversation_id not in conversations[user_id]:
-        raise HTTPException(
-            status_code=HTTP_404_NOT_FOUND,
-            detail="Conversa não encontrada"
-        )
-    messages = get_messages(user_id, conversation_id)
-    return [
-        Message(
-            role=message["role"],
-            content=message["content"],
-            timestamp=message["timestamp"],
-        ) for message in messages
-    ]
+    messages = await get_messages(user_id, conversation_id, offset, limit, before)
+    # As mensagens já estão no formato de Message: serializa direto, sem
+    # construir um modelo Pydantic por item
+    return Response(content=orjson.dumps(messages), media_type="application/json")
 
 
 @app.post("/api/generate", tags=["Chat"])
 async def generate(
+    http_request: Request,
     request: GenerateRequest,
     current_user: dict = Depends(get_current_user),
 ):
     """
     Gera resposta em tipo Stream com base non prompt informado
+
+    Prompts repetidos são respondidos pelo cache, reenviados em pedaços via SSE.
+    Requisições idênticas simultâneas compartilham a mesma chamada ao modelo.
+    Se o cliente desconectar, a chamada ao modelo é cancelada (quando não há
+    outros assinantes do mesmo stream).
     """
     model = request.model or DEFAULT_MODEL
-    llm = ChatOpenAI(model=model, streaming=True, temperature=0.2)
+    llm = llm_registry.get(model, temperature=0.2, streaming=True)
+    cached = None
+    if RESPONSE_CACHE_ENABLED:
+        cached = await response_cache.get(model, request.prompt, 0.2)
 
-    async def generate_stream():
+    async def upstream():
+        from langchain_core.messages import HumanMessage
+
+        chunks = []
         async for chunk in llm.astream([HumanMessage(content=request.prompt)]):
             if chunk.content:
-                yield f"data: {chunk.content}\n\n"
-        yield "data: [DONE]\n\n"
+                chunks.append(chunk.content)
+                yield chunk.content
+        # Só guarda respostas completas
+        if RESPONSE_CACHE_ENABLED:
+            await response_cache.set(model, request.prompt, 0.2, "".join(chunks))
+
+    def tracked_upstream():
+        # Medido e escalonado só na chamada real ao provedor (não nos assinantes coalescidos)
+        return llm_scheduler.stream(current_user["username"], STANDARD, track_stream(
+            upstream(), llm_time_to_first_token, llm_tokens_per_second, "/api/generate", model))
+
+    async def generate_stream():
+        if cached is not None:
+            for piece in iter_chunks(cached):
+                yield sse_event(piece)
+            yield DONE_EVENT
+            return
+        key = response_cache.make_key(model, request.prompt, 0.2)
+        async for piece in coalesce(single_flight.stream(key, tracked_upstream), SSE_COALESCE_SECONDS):
+            yield sse_event(piece)
+        yield DONE_EVENT
+
+    release_stream = reserve_stream(current_user["username"])
+    return stream_response(http_request, generate_stream(), release_stream)
+
+
+BATCH_RATE_LIMIT = parse_rate_limit(settings.batch_rate_limit)
 
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream"
-    )
+
+@app.post("/api/generate/batch", tags=["Chat"])
+async def generate_batch(
+    http_request: Request,
+    request: GenerateBatchRequest,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Gera respostas para vários prompts com concorrência limitada.
+
+    Resposta em NDJSON, uma linha por prompt na ordem em que ficam prontos:
+    `{"index": 0, "response": "...", "cached": false}` ou, se aquele prompt
+    falhar, `{"index": 0, "error": "..."}` (os demais continuam).
+
+    **Rate Limiting:** o lote conta como uma requisição com peso igual ao
+    número de prompts (BATCH_RATE_LIMIT, padrão 300/minute).
+    """
+    if len(request.prompts) > settings.batch_max_prompts:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo de {settings.batch_max_prompts} prompts por lote",
+        )
+    # Vaga de stream antes do rate limit: um lote recusado pelo limite de
+    # streams não gasta o orçamento ponderado
+    release_stream = reserve_stream(current_user["username"])
+    try:
+        charge_rate_limit(http_request, BATCH_RATE_LIMIT, "/api/generate/batch", cost=len(request.prompts))
+    except HTTPException:
+        release_stream()
+        raise
+    model = request.model or DEFAULT_MODEL
+
+    async def generate_one(prompt: str) -> dict:
+        from langchain_core.messages import HumanMessage
+
+        if RESPONSE_CACHE_ENABLED:
+            cached = await response_cache.get(model, prompt, 0.2)
+            if cached is not None:
+                return {"response": cached, "cached": True}
+        content = await invoke_model(model, [HumanMessage(content=prompt)], "/api/generate/batch",
+                                     current_user["username"], BATCH)
+        if RESPONSE_CACHE_ENABLED:
+            await response_cache.set(model, prompt, 0.2, content)
+        return {"response": content, "cached": False}
+
+    async def lines():
+        async for index, result in map_as_completed(generate_one, request.prompts, settings.batch_concurrency):
+            if isinstance(result, Exception):
+                log_structured(
+                    "WARNING",
+                    "Erro em item do lote",
+                    user_id=current_user["username"],
+                    index=index,
+                    error=str(result),
+                )
+                item = {"index": index, "error": str(result)}
+            else:
+                item = {"index": index, **result}
+            yield orjson.dumps(item) + b"\n"
+
+    return stream_response(http_request, lines(), release_stream,
+                           media_type="application/x-ndjson", heartbeat=False)
 
 
 @app.get("/health", tags=["Health"])
 async def health():
     """
-    Checa se o servidor está rodando.
+    Checa se o servidor está rodando e retorna os contadores do cache de respostas.
+    """
+    return {
+        "status": "healthy",
+        "feature": "rate_limiting_logging",
+        "response_cache": response_cache.stats(),
+        "single_flight": {
+            "upstream_calls": single_flight.upstream_calls,
+            "coalesced": single_flight.coalesced,
+        },
+    }
+
+
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def metrics_endpoint():
+    """
+    Métricas no formato de texto do Prometheus.
     """
-    return {"status": "healthy", "feature": "rate_limiting_logging"}
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
 
 
 if __name__ == "__main__":
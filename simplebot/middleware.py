@@ -0,0 +1,161 @@
+"""
+Middlewares ASGI puros do SimpleBot.
+
+Diferente do BaseHTTPMiddleware, não criam task nem memory stream por
+requisição: apenas embrulham o `send` e atuam na mensagem
+`http.response.start`, sem interferir no corpo de um StreamingResponse.
+"""
+
+import random
+import time
+from typing import Callable, List, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import Gauge, Histogram
+
+Headers = List[Tuple[bytes, bytes]]
+
+DOCS_PATHS = frozenset({"/docs", "/redoc", "/openapi.json"})
+
+_COMMON_HEADERS: Headers = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    # Strict Transport Security (força HTTPS)
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    # Referrer Policy (controla informações enviadas)
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    # Permissions Policy (controla features do navegador)
+    (b"permissions-policy", b"geolocation=(), microphone=()"),
+]
+
+# CSP mais permissivo para Swagger UI (permite CDNs e scripts inline)
+DOCS_SECURITY_HEADERS: Headers = _COMMON_HEADERS + [(
+    b"content-security-policy",
+    b"default-src 'self'; "
+    b"script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net https://unpkg.com; "
+    b"style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://fonts.googleapis.com; "
+    b"font-src 'self' https://fonts.gstatic.com; "
+    b"img-src 'self' data: https:; "
+    b"connect-src 'self'",
+)]
+
+# CSP restritivo para rotas da API
+API_SECURITY_HEADERS: Headers = _COMMON_HEADERS + [
+    (b"content-security-policy", b"default-src 'self'"),
+]
+
+
+class SecurityHeadersMiddleware:
+    """
+    Adiciona os headers de segurança (já codificados) na resposta.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        security_headers = DOCS_SECURITY_HEADERS if scope["path"] in DOCS_PATHS else API_SECURITY_HEADERS
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *security_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class RequestLoggingMiddleware:
+    """
+    Registra método, caminho, status e duração de cada requisição.
+    A duração inclui o envio completo do corpo (também em streams).
+
+    Args:
+        log: Função de log estruturado (level, message, **campos)
+        sample_rate: Fração das respostas < 400 registradas (erros sempre são)
+    """
+
+    def __init__(self, app: ASGIApp, log: Callable[..., None], sample_rate: float = 1.0):
+        self.app = app
+        self.log = log
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampled_out = status_code < 400 and random.random() >= self.sample_rate
+            if not sampled_out:
+                client = scope.get("client")
+                self.log(
+                    "INFO",
+                    "Request processada",
+                    method=scope["method"],
+                    path=scope["path"],
+                    status_code=status_code,
+                    duration_ms=round((time.perf_counter() - start_time) * 1000, 2),
+                    client_ip=client[0] if client else None,
+                )
+
+
+class MetricsMiddleware:
+    """
+    Mede latência (até o fim do corpo) por rota e requisições em andamento.
+
+    A rota é o template (ex.: `/conversations/{conversation_id}/messages`),
+    não o caminho bruto, para não criar uma série por id.
+
+    Args:
+        duration: Histograma com labels (method, route, status)
+        in_flight: Gauge sem labels
+    """
+
+    def __init__(self, app: ASGIApp, duration: Histogram, in_flight: Gauge):
+        self.app = app
+        self.duration = duration
+        self.in_flight = in_flight
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            self.duration.observe(
+                time.perf_counter() - start_time,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            )
@@ -0,0 +1,229 @@
+"""
+Storages de rate limit compartilhados entre workers do SimpleBot.
+
+O `Limiter` do slowapi guarda os contadores em memória do processo: com N
+workers cada um conta sozinho e o limite efetivo fica N vezes maior. Aqui
+ficam dois storages do pacote `limits`, registrados pelo esquema da URI:
+
+- `sqlite:///caminho.db`: contadores em um arquivo SQLite (WAL) visível a
+  todos os workers da máquina. Para várias máquinas use `redis://...`
+  (storage nativo do `limits`, requer o pacote redis).
+- `batched+<uri>`: pré-checagem local na frente de outro storage. Cada
+  worker conta as batidas em memória e só sincroniza com o storage
+  compartilhado a cada `sync_every` batidas ou `sync_interval` segundos.
+  O excesso possível é de `sync_every - 1` batidas por worker na janela.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple, Type
+
+from limits.storage import Storage, storage_from_string
+
+
+def _sqlite_path(uri: str) -> str:
+    """
+    Converte `sqlite:///rel.db` em `rel.db` e `sqlite:////abs.db` em `/abs.db`.
+    """
+    rest = uri.split("://", 1)[1]
+    return rest[1:] if rest.startswith("/") else rest
+
+
+class SQLiteStorage(Storage):
+    """
+    Contadores de janela fixa em SQLite, compartilhados entre processos.
+
+    Cada batida é um único UPSERT atômico (reinicia o contador se a janela
+    expirou). Uma conexão por thread, em modo WAL.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, timeout: float = 5.0, **options):
+        self.path = _sqlite_path(uri)
+        self.timeout = timeout
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        conn = self._conn()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    @property
+    def base_exceptions(self) -> Type[Exception]:
+        return sqlite3.Error
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        row = self._conn().execute(
+            """
+            INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END,
+                expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END
+            RETURNING count
+            """,
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        return row[0]
+
+    def get(self, key: str) -> int:
+        row = self._conn().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._conn().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._conn().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self._conn().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        self._conn().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+
+class _LocalCounter:
+    __slots__ = ("shared", "pending", "expires_at", "synced_at")
+
+    def __init__(self):
+        self.shared = 0       # último total visto no storage compartilhado
+        self.pending = 0      # batidas locais ainda não enviadas
+        self.expires_at = 0.0
+        self.synced_at = 0.0
+
+
+class BatchedStorage(Storage):
+    """
+    Pré-checagem local com sincronização em lotes.
+
+    A batida é respondida com o último total compartilhado + as batidas
+    locais pendentes, sem ida ao storage remoto. O envio acontece na
+    primeira batida da janela, a cada `sync_every` batidas ou após
+    `sync_interval` segundos; o total devolvido pelo storage compartilhado
+    já inclui o que os outros workers contaram.
+
+    Args:
+        uri: `batched+<uri do storage compartilhado>`
+        sync_every: Batidas locais acumuladas antes de sincronizar
+        sync_interval: Tempo máximo (s) entre sincronizações de uma chave
+        max_keys: Chaves mantidas em memória (as expiradas são descartadas antes)
+    """
+
+    STORAGE_SCHEME = ["batched+sqlite", "batched+redis", "batched+memory"]
+
+    def __init__(
+        self,
+        uri: str,
+        wrap_exceptions: bool = False,
+        sync_every: int = 5,
+        sync_interval: float = 1.0,
+        max_keys: int = 100_000,
+        **options,
+    ):
+        self.shared = storage_from_string(uri.split("+", 1)[1], **options)
+        self.sync_every = max(1, int(sync_every))
+        self.sync_interval = float(sync_interval)
+        self.max_keys = max_keys
+        self._counters: Dict[str, _LocalCounter] = {}
+        self._lock = threading.Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self) -> Tuple[Type[Exception], ...]:
+        base = self.shared.base_exceptions
+        return base if isinstance(base, tuple) else (base,)
+
+    def _sync(self, key: str, counter: _LocalCounter, expiry: float, now: float) -> None:
+        pending, counter.pending = counter.pending, 0
+        counter.shared = self.shared.incr(key, expiry, amount=pending)
+        counter.expires_at = self.shared.get_expiry(key)
+        counter.synced_at = now
+
+    def _prune(self, now: float) -> None:
+        for key in [key for key, counter in self._counters.items() if counter.expires_at <= now]:
+            del self._counters[key]
+        while len(self._counters) >= self.max_keys:
+            self._counters.pop(next(iter(self._counters)))
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None or counter.expires_at <= now:
+                # Janela nova: pendências da janela anterior já não contam
+                if counter is None and len(self._counters) >= self.max_keys:
+                    self._prune(now)
+                counter = self._counters[key] = _LocalCounter()
+                counter.pending = amount
+                self._sync(key, counter, expiry, now)
+            else:
+                counter.pending += amount
+                if counter.pending >= self.sync_every or now - counter.synced_at >= self.sync_interval:
+                    self._sync(key, counter, expiry, now)
+            return counter.shared + counter.pending
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None and counter.expires_at > time.time():
+                return counter.shared + counter.pending
+        return self.shared.get(key)
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None and counter.expires_at > time.time():
+                return counter.expires_at
+        return self.shared.get_expiry(key)
+
+    def flush(self) -> None:
+        """
+        Envia as batidas pendentes de todas as chaves (ex.: no shutdown).
+        """
+        now = time.time()
+        with self._lock:
+            for key, counter in self._counters.items():
+                if counter.pending and counter.expires_at > now:
+                    self._sync(key, counter, max(1, int(counter.expires_at - now)), now)
+
+    def check(self) -> bool:
+        return self.shared.check()
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._counters.clear()
+        return self.shared.reset()
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._counters.pop(key, None)
+        self.shared.clear(key)
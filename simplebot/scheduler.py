@@ -0,0 +1,139 @@
+"""
+Escalonador das chamadas ao LLM do SimpleBot.
+
+Fica na frente de toda chamada ao modelo e limita quantas rodam ao mesmo
+tempo (`max_concurrent`, ajustado ao limite do provedor). Acima do limite
+as chamadas esperam na fila em vez de falhar:
+
+- por prioridade: INTERACTIVE (/chat) antes de STANDARD (/api/generate)
+  antes de BATCH (/api/generate/batch);
+- dentro da mesma prioridade, rodízio entre usuários: quem tem muitas
+  chamadas na fila não passa na frente de quem tem uma.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, List, Optional
+
+INTERACTIVE = 0
+STANDARD = 1
+BATCH = 2
+PRIORITY_NAMES = ("interactive", "standard", "batch")
+
+
+class QueueTimeout(Exception):
+    """
+    A chamada esperou mais que `queue_timeout` por uma vaga.
+    """
+
+
+class LLMScheduler:
+    """
+    Fila justa por usuário com prioridades e teto global de concorrência.
+
+    Args:
+        max_concurrent: Chamadas simultâneas ao provedor
+        queue_timeout: Espera máxima (s) na fila; 0 = espera até ser atendida
+        on_wait: Função (segundos na fila, prioridade) chamada ao obter a vaga
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        queue_timeout: float = 0,
+        on_wait: Optional[Callable[[float, int], None]] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.on_wait = on_wait
+        self.active = 0
+        # Uma fila por prioridade: usuário -> esperas dele, em ordem de rodízio
+        self._queues: List["OrderedDict[str, Deque[asyncio.Future]]"] = [
+            OrderedDict() for _ in PRIORITY_NAMES
+        ]
+        self._waiting = [0] * len(PRIORITY_NAMES)
+
+    def queue_depth(self, priority: int) -> int:
+        return self._waiting[priority]
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: int = STANDARD) -> AsyncIterator[None]:
+        """
+        Ocupa uma vaga de chamada ao LLM pelo tempo do bloco `async with`.
+        """
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        if self.active < self.max_concurrent and not any(self._waiting):
+            self.active += 1
+        else:
+            await self._wait(loop, user_id, priority)
+        if self.on_wait is not None:
+            self.on_wait(loop.time() - started_at, priority)
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._dispatch()
+
+    async def stream(self, user_id: str, priority: int, source: AsyncIterator) -> AsyncIterator:
+        """
+        Itera `source` (ex.: astream do modelo) ocupando uma vaga até o fim.
+        """
+        try:
+            async with self.slot(user_id, priority):
+                async for item in source:
+                    yield item
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def _wait(self, loop: asyncio.AbstractEventLoop, user_id: str, priority: int) -> None:
+        waiter = loop.create_future()
+        queue = self._queues[priority].setdefault(user_id, deque())
+        queue.append(waiter)
+        self._waiting[priority] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout or None)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve
+                self.active -= 1
+                self._dispatch()
+            else:
+                self._remove(priority, user_id, waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise QueueTimeout(f"Sem vaga para chamar o modelo em {self.queue_timeout}s") from None
+            raise
+
+    def _remove(self, priority: int, user_id: str, waiter: asyncio.Future) -> None:
+        queue = self._queues[priority].get(user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self._waiting[priority] -= 1
+        if not queue:
+            del self._queues[priority][user_id]
+
+    def _dispatch(self) -> None:
+        """
+        Entrega as vagas livres: maior prioridade primeiro, rodízio de usuários.
+        """
+        for priority, users in enumerate(self._queues):
+            while users and self.active < self.max_concurrent:
+                user_id, queue = next(iter(users.items()))
+                waiter = queue.popleft()
+                self._waiting[priority] -= 1
+                if queue:
+                    # Próxima vez é a vez do próximo usuário
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if waiter.done():
+                    # Cancelado (timeout/desconexão) antes de sair da fila
+                    continue
+                self.active += 1
+                waiter.set_result(None)
+            if self.active >= self.max_concurrent:
+                return
@@ -0,0 +1,96 @@
+"""
+Configuração do SimpleBot carregada uma única vez das variáveis de ambiente
+(e do .env), validada e tipada com pydantic-settings.
+
+Cada campo corresponde à variável de mesmo nome em maiúsculas
+(ex.: `context_max_tokens` <- CONTEXT_MAX_TOKENS). Valores ausentes ou
+inválidos nas obrigatórias interrompem o startup com a lista dos campos.
+"""
+
+from typing import Literal, Optional
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(case_sensitive=False, extra="ignore")
+
+    # JWT (obrigatórias)
+    jwt_secret_key: str
+    algorithm: str
+    access_token_expire_minutes: int
+    refresh_token_expire_days: int
+    jwt_cache_size: int = 10_000
+
+    default_model: str = "gpt-4o-mini"
+
+    # Conversações (memory | sqlite)
+    conversation_store: Literal["memory", "sqlite"] = "memory"
+    conversation_db_path: str = "conversations.db"
+    conversation_max: int = 10_000
+    conversation_ttl_seconds: float = 0
+    conversation_max_bytes: int = 0
+
+    # Janela de contexto do /chat ("none" desativa o resumo; vazio = default_model)
+    context_max_tokens: int = 3000
+    context_slide_ratio: float = 0.5
+    context_summary_model: str = ""
+
+    # Clientes LLM e pool HTTP
+    llm_max_connections: int = 100
+    llm_max_keepalive: int = 20
+    llm_keepalive_expiry: float = 30
+    llm_http2: bool = True
+    llm_timeout: float = 60
+    llm_single_flight_queue: int = 64
+    # Escalonador: chamadas simultâneas ao provedor e espera máxima na fila (0 = sem limite)
+    llm_max_concurrent: int = 16
+    llm_queue_timeout: float = 0
+    sse_coalesce_ms: float = 20
+    sse_heartbeat_seconds: float = 15
+    sse_buffer_size: int = 32
+    sse_disconnect_check_seconds: float = 1.0
+    max_streams_per_user: int = 5
+
+    # /api/generate/batch: prompts por requisição, chamadas simultâneas por
+    # lote e limite do rate limit (cada prompt conta uma batida)
+    batch_max_prompts: int = 100
+    batch_concurrency: int = 8
+    batch_rate_limit: str = "300/minute"
+
+    # Cache de respostas
+    response_cache: bool = True
+    response_cache_semantic_model: str = ""
+    response_cache_max_entries: int = 1000
+    response_cache_ttl_seconds: float = 3600
+    response_cache_db_path: Optional[str] = None
+    response_cache_similarity: float = 0.95
+
+    # Rate limit
+    rate_limit_storage_uri: str = "memory://"
+    rate_limit_sync_every: int = 5
+    rate_limit_sync_interval: float = 1.0
+
+    # Usuários e bcrypt
+    users_file: Optional[str] = None
+    password_hash_workers: int = 2
+
+    # Logging
+    log_batch_size: int = 100
+    log_flush_interval: float = 0.5
+    log_queue_size: int = 10_000
+    log_request_sample_rate: float = 1.0
+
+
+def load_settings() -> Settings:
+    """
+    Lê o .env (também usado pelo cliente da OpenAI) e valida a configuração.
+    """
+    load_dotenv()
+    try:
+        return Settings()
+    except ValidationError as exc:
+        fields = ", ".join(f"{str(error['loc'][0]).upper()} ({error['msg']})" for error in exc.errors())
+        raise Exception(f"Favor verificar {fields}") from None
@@ -0,0 +1,188 @@
+"""
+Utilitários de Server-Sent Events do SimpleBot.
+"""
+
+import asyncio
+import weakref
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+DONE_EVENT = "data: [DONE]\n\n"
+# Comentário SSE: ignorado pelo cliente, mantém proxies e a conexão vivos
+HEARTBEAT_EVENT = ": ping\n\n"
+
+_END = object()
+
+
+def sse_event(data: str) -> str:
+    """
+    Formata um evento SSE de dados.
+    """
+    return f"data: {data}\n\n"
+
+
+async def coalesce(source: AsyncIterator[str], window: float = 0.02, max_chars: int = 1024) -> AsyncIterator[str]:
+    """
+    Agrupa pedaços pequenos que chegam dentro de uma janela de tempo.
+
+    O primeiro pedaço pendente abre a janela; ela é enviada quando `window`
+    segundos se passam ou quando acumula `max_chars`. Assim tokens de poucos
+    caracteres não custam uma escrita no socket cada. Com `window <= 0`
+    os pedaços passam sem agrupamento.
+    """
+    if window <= 0:
+        async for chunk in source:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    pending: List[str] = []
+    pending_chars = 0
+    deadline = 0.0
+    next_chunk: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if pending else None
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                # Janela expirou com o próximo pedaço ainda a caminho
+                yield "".join(pending)
+                pending, pending_chars = [], 0
+                continue
+            future, next_chunk = next_chunk, None
+            try:
+                chunk = future.result()
+            except StopAsyncIteration:
+                break
+            if not pending:
+                deadline = loop.time() + window
+            pending.append(chunk)
+            pending_chars += len(chunk)
+            if pending_chars >= max_chars:
+                yield "".join(pending)
+                pending, pending_chars = [], 0
+        if pending:
+            yield "".join(pending)
+    finally:
+        if next_chunk is not None:
+            # Cancela a leitura em andamento e espera o gerador sair dela
+            next_chunk.cancel()
+            await asyncio.wait({next_chunk})
+            if not next_chunk.cancelled():
+                next_chunk.exception()
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def guarded_stream(
+    source: AsyncIterator[str],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    heartbeat_interval: float = 15.0,
+    buffer_size: int = 32,
+    check_interval: float = 1.0,
+) -> AsyncIterator[str]:
+    """
+    Entrega os eventos de `source` ao cliente com:
+
+    - buffer limitado: `source` roda em uma task que para de ler (e de puxar
+      tokens do modelo) quando o cliente não acompanha;
+    - heartbeat: comentário SSE após `heartbeat_interval` segundos sem eventos;
+    - desconexão: a cada `check_interval` segundos consulta `is_disconnected()`
+      e, se o cliente saiu, cancela `source` (e a chamada ao modelo).
+    """
+    buffer: asyncio.Queue = asyncio.Queue(buffer_size)
+
+    async def produce() -> None:
+        try:
+            async for item in source:
+                await buffer.put(item)
+            await buffer.put(_END)
+        except Exception as exc:
+            await buffer.put(exc)
+
+    producer = asyncio.create_task(produce())
+    loop = asyncio.get_running_loop()
+    last_event = last_check = loop.time()
+    try:
+        while True:
+            now = loop.time()
+            if now - last_check >= check_interval:
+                last_check = now
+                if await is_disconnected():
+                    return
+            timeout = min(heartbeat_interval - (now - last_event), check_interval - (now - last_check))
+            try:
+                item = await asyncio.wait_for(buffer.get(), timeout=max(0.0, timeout))
+            except asyncio.TimeoutError:
+                if loop.time() - last_event >= heartbeat_interval:
+                    last_event = loop.time()
+                    yield HEARTBEAT_EVENT
+                continue
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            last_event = loop.time()
+            yield item
+    finally:
+        # Cancela a leitura em andamento: o `finally` de `source` roda na task
+        producer.cancel()
+        await asyncio.wait({producer})
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class StreamLimiter:
+    """
+    Limite de streams simultâneos por usuário (0 = sem limite).
+    """
+
+    def __init__(self, max_per_user: int = 0):
+        self.max_per_user = max_per_user
+        self._active: Dict[str, int] = {}
+
+    def active(self, user_id: str) -> int:
+        return self._active.get(user_id, 0)
+
+    def acquire(self, user_id: str) -> Optional[Callable[[], None]]:
+        """
+        Reserva uma vaga; retorna a função (idempotente) que a libera,
+        ou None se o usuário já está no limite.
+        """
+        if self.max_per_user and self.active(user_id) >= self.max_per_user:
+            return None
+        self._active[user_id] = self.active(user_id) + 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if released:
+                return
+            released = True
+            remaining = self._active.get(user_id, 1) - 1
+            if remaining > 0:
+                self._active[user_id] = remaining
+            else:
+                self._active.pop(user_id, None)
+
+        return release
+
+    def wrap(self, stream: AsyncIterator[str], release: Callable[[], None]) -> AsyncIterator[str]:
+        """
+        Libera a vaga quando o stream termina, é fechado ou descartado sem
+        ter sido iniciado (ex.: cliente saiu antes do primeiro byte).
+        """
+        async def guarded() -> AsyncIterator[str]:
+            try:
+                async for item in stream:
+                    yield item
+            finally:
+                release()
+
+        wrapped = guarded()
+        weakref.finalize(wrapped, release)
+        return wrapped
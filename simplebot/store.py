@@ -0,0 +1,708 @@
+"""
+Armazenamento de conversas do SimpleBot.
+
+Define a interface `ConversationStore` e dois backends:
+
+- `InMemoryConversationStore`: memória local com expiração LRU/TTL e teto de memória.
+- `SQLiteConversationStore`: SQLite em modo WAL, compartilhável entre workers.
+
+Os handlers chamam os métodos via `await store.run(método, ...)`: no backend
+em memória a chamada é direta; no SQLite (I/O bloqueante, espera por locks
+de escrita) ela roda em um pool de threads próprio, fora do event loop.
+
+O backend é escolhido por `create_conversation_store()` a partir da
+configuração (`CONVERSATION_STORE`, `CONVERSATION_DB_PATH`, `CONVERSATION_MAX`,
+`CONVERSATION_TTL_SECONDS` e `CONVERSATION_MAX_BYTES`, ver settings.py).
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Página de conversas: (resumos, cursor da próxima página ou None)
+ConversationPage = Tuple[List[Dict], Optional[str]]
+# Estado da janela de contexto: (início da janela, resumo das mensagens anteriores)
+ContextState = Tuple[int, Optional[str]]
+
+
+def approximate_tokens(text: str) -> int:
+    """
+    Estimativa simples de tokens (~4 caracteres por token).
+    """
+    return len(text) // 4 + 1
+
+
+def to_langchain_message(role: str, content: str):
+    """
+    Converte uma mensagem armazenada para o tipo de mensagem do LangChain.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    if role == "user":
+        return HumanMessage(content=content)
+    return AIMessage(content=content)
+
+
+# Memória de uma mensagem além do conteúdo: dict, timestamp, mensagem do
+# LangChain e soma de tokens (~1,2 KB medidos com tracemalloc)
+MESSAGE_OVERHEAD_BYTES = 1200
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _utc_iso(value: datetime) -> str:
+    """
+    Converte para o mesmo formato dos timestamps gravados (UTC, isoformat),
+    que então podem ser comparados como texto. Sem fuso = UTC.
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc).isoformat()
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def _encode_cursor(summary: Dict) -> str:
+    return f"{summary['updated_at']}|{summary['id']}"
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    if not cursor:
+        return None
+    updated_at, _, conversation_id = cursor.partition("|")
+    return updated_at, conversation_id
+
+
+class ConversationStore(ABC):
+    """
+    Interface comum dos backends de conversas.
+
+    Cada mensagem tem sua contagem de tokens calculada uma única vez em
+    `add_message` (via `token_counter`) e acumulada por conversa.
+    """
+
+    token_counter: Callable[[str], int] = staticmethod(approximate_tokens)
+
+    async def run(self, method: Callable[..., T], *args: Any) -> T:
+        """
+        Executa um método do backend a partir do event loop. Por padrão chama
+        direto (operações em memória); backends bloqueantes sobrescrevem.
+        """
+        return method(*args)
+
+    @abstractmethod
+    def get_or_create_conversation(self, user_id: str, conversation_id: Optional[str] = None) -> str:
+        """
+        Retorna o conversation_id existente ou cria uma nova conversa.
+        """
+
+    @abstractmethod
+    def has_conversation(self, user_id: str, conversation_id: str) -> bool:
+        """
+        Indica se a conversa existe para o usuário.
+        """
+
+    @abstractmethod
+    def add_message(self, user_id: str, conversation_id: str, role: str, content: str) -> None:
+        """
+        Adiciona uma mensagem ao fim da conversa (cria a conversa se preciso).
+        """
+
+    @abstractmethod
+    def get_messages(
+        self,
+        user_id: str,
+        conversation_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        before: Optional[datetime] = None,
+    ) -> List[Dict]:
+        """
+        Retorna as mensagens da conversa em ordem cronológica.
+
+        Args:
+            offset: Posição da primeira mensagem
+            limit: Quantidade máxima de mensagens
+            before: Apenas mensagens com timestamp anterior a este; com `limit`,
+                retorna as `limit` mais recentes antes dele
+
+        Os dicts retornados podem ser compartilhados com o backend e não devem
+        ser alterados.
+        """
+
+    @abstractmethod
+    def get_langchain_messages(self, user_id: str, conversation_id: str, offset: int = 0) -> list:
+        """
+        Retorna as mensagens a partir de `offset` já convertidas para o
+        LangChain. A conversão é feita uma vez por mensagem e reaproveitada.
+        """
+
+    @abstractmethod
+    def token_count(self, user_id: str, conversation_id: str, start: int = 0) -> int:
+        """
+        Soma dos tokens das mensagens a partir da posição `start`.
+        """
+
+    @abstractmethod
+    def window_start(self, user_id: str, conversation_id: str, max_tokens: int) -> int:
+        """
+        Posição da mensagem mais antiga tal que as mensagens dela até o fim
+        caibam em `max_tokens`. A última mensagem sempre entra na janela.
+        """
+
+    @abstractmethod
+    def list_conversations(self, user_id: str, cursor: Optional[str] = None, limit: Optional[int] = None) -> ConversationPage:
+        """
+        Retorna os resumos das conversas do usuário, da atividade mais recente
+        para a mais antiga, a partir do cursor informado.
+        """
+
+    @abstractmethod
+    def get_context_state(self, user_id: str, conversation_id: str) -> ContextState:
+        """
+        Início da janela de contexto e resumo das mensagens anteriores a ela
+        (ver context.py). `(0, None)` se a janela nunca deslizou.
+        """
+
+    @abstractmethod
+    def set_context_state(self, user_id: str, conversation_id: str, start: int, summary: Optional[str]) -> None:
+        """
+        Grava o estado da janela. Um início menor que o já gravado (outro
+        worker deslizou a janela antes) é ignorado.
+        """
+
+    def close(self) -> None:
+        """
+        Libera recursos do backend (conexões, arquivos).
+        """
+
+
+# =============================================================================
+# Backend em memória
+# =============================================================================
+
+class _MemoryConversation:
+    __slots__ = ("messages", "langchain_messages", "cum_tokens", "summary", "context", "last_access", "size")
+
+    def __init__(self, conversation_id: str):
+        self.messages: List[Dict] = []
+        self.langchain_messages: list = []
+        # Soma acumulada de tokens: cum_tokens[i] = tokens de messages[0..i]
+        self.cum_tokens: List[int] = []
+        created_at = _now_iso()
+        # Resumo mantido a cada add_message (evita recalcular na listagem)
+        self.summary = {
+            "id": conversation_id,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "last_message": None,
+            "message_count": 0,
+        }
+        self.context: ContextState = (0, None)
+        self.last_access = time.monotonic()
+        self.size = 0
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Backend em memória com expiração LRU/TTL.
+
+    Args:
+        max_conversations: Quantidade máxima de conversas mantidas (0 = sem limite)
+        ttl_seconds: Tempo sem acesso até a conversa expirar (0 = sem expiração)
+        max_bytes: Teto aproximado de memória ocupada pelas mensagens: conteúdo
+            mais `MESSAGE_OVERHEAD_BYTES` por mensagem (0 = sem limite)
+        token_counter: Função de contagem de tokens de um texto
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = 10_000,
+        ttl_seconds: float = 0,
+        max_bytes: int = 0,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        if token_counter is not None:
+            self.token_counter = token_counter
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # Chave (user_id, conversation_id), ordenada da menos para a mais recente
+        self._conversations: "OrderedDict[Tuple[str, str], _MemoryConversation]" = OrderedDict()
+        # Índice por usuário: conversation_id -> resumo, da menos para a mais recente
+        self._user_index: Dict[str, "OrderedDict[str, Dict]"] = {}
+        self._lock = threading.RLock()
+
+    def _touch(self, key: Tuple[str, str]) -> Optional[_MemoryConversation]:
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return None
+        now = time.monotonic()
+        if self.ttl_seconds and now - conversation.last_access > self.ttl_seconds:
+            self._remove(key)
+            return None
+        conversation.last_access = now
+        self._conversations.move_to_end(key)
+        return conversation
+
+    def _create(self, key: Tuple[str, str]) -> _MemoryConversation:
+        conversation = _MemoryConversation(key[1])
+        self._conversations[key] = conversation
+        self._user_index.setdefault(key[0], OrderedDict())[key[1]] = conversation.summary
+        self._evict()
+        return conversation
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        conversation = self._conversations.pop(key)
+        self.total_bytes -= conversation.size
+        user_conversations = self._user_index.get(key[0])
+        if user_conversations is not None:
+            user_conversations.pop(key[1], None)
+            if not user_conversations:
+                del self._user_index[key[0]]
+
+    def _evict(self) -> None:
+        """
+        Remove conversas expiradas e as menos usadas até respeitar os limites.
+        A conversa mais recente nunca é removida.
+        """
+        now = time.monotonic()
+        while len(self._conversations) > 1:
+            key, oldest = next(iter(self._conversations.items()))
+            expired = self.ttl_seconds and now - oldest.last_access > self.ttl_seconds
+            over_count = self.max_conversations and len(self._conversations) > self.max_conversations
+            over_bytes = self.max_bytes and self.total_bytes > self.max_bytes
+            if not (expired or over_count or over_bytes):
+                break
+            self._remove(key)
+
+    def get_or_create_conversation(self, user_id: str, conversation_id: Optional[str] = None) -> str:
+        with self._lock:
+            if conversation_id and self._touch((user_id, conversation_id)) is not None:
+                return conversation_id
+            new_id = str(uuid.uuid4())
+            self._create((user_id, new_id))
+            return new_id
+
+    def has_conversation(self, user_id: str, conversation_id: str) -> bool:
+        with self._lock:
+            return self._touch((user_id, conversation_id)) is not None
+
+    def add_message(self, user_id: str, conversation_id: str, role: str, content: str) -> None:
+        key = (user_id, conversation_id)
+        with self._lock:
+            conversation = self._touch(key) or self._create(key)
+            message = {
+                "role": role,
+                "content": content,
+                "timestamp": _now_iso(),
+            }
+            conversation.messages.append(message)
+            conversation.langchain_messages.append(to_langchain_message(role, content))
+            previous = conversation.cum_tokens[-1] if conversation.cum_tokens else 0
+            conversation.cum_tokens.append(previous + self.token_counter(content))
+            summary = conversation.summary
+            summary["updated_at"] = message["timestamp"]
+            summary["last_message"] = content
+            summary["message_count"] += 1
+            self._user_index[user_id].move_to_end(conversation_id)
+            size = len(content) + MESSAGE_OVERHEAD_BYTES
+            conversation.size += size
+            self.total_bytes += size
+            self._evict()
+
+    def get_messages(
+        self,
+        user_id: str,
+        conversation_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        before: Optional[datetime] = None,
+    ) -> List[Dict]:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            if conversation is None:
+                return []
+            messages = conversation.messages
+            # Copia apenas a fatia pedida, não o histórico inteiro
+            end = len(messages)
+            if before is not None:
+                end = bisect_left(messages, _utc_iso(before), key=lambda message: message["timestamp"])
+            start = min(offset, end)
+            if limit is not None:
+                if before is not None:
+                    start = max(start, end - limit)
+                else:
+                    end = min(end, start + limit)
+            return messages[start:end]
+
+    def get_langchain_messages(self, user_id: str, conversation_id: str, offset: int = 0) -> list:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            if conversation is None:
+                return []
+            return conversation.langchain_messages[offset:]
+
+    def token_count(self, user_id: str, conversation_id: str, start: int = 0) -> int:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            if conversation is None or start >= len(conversation.cum_tokens):
+                return 0
+            cum_tokens = conversation.cum_tokens
+            return cum_tokens[-1] - (cum_tokens[start - 1] if start > 0 else 0)
+
+    def window_start(self, user_id: str, conversation_id: str, max_tokens: int) -> int:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            if conversation is None or not conversation.cum_tokens:
+                return 0
+            cum_tokens = conversation.cum_tokens
+            excess = cum_tokens[-1] - max_tokens
+            if excess <= 0:
+                return 0
+            # Primeira posição cujo acumulado anterior já cobre o excesso
+            start = bisect_left(cum_tokens, excess) + 1
+            return min(start, len(cum_tokens) - 1)
+
+    def list_conversations(self, user_id: str, cursor: Optional[str] = None, limit: Optional[int] = None) -> ConversationPage:
+        after = _decode_cursor(cursor)
+        now = time.monotonic()
+        result = []
+        expired = []
+        next_cursor = None
+        with self._lock:
+            for conversation_id, summary in reversed(self._user_index.get(user_id, {}).items()):
+                conversation = self._conversations[(user_id, conversation_id)]
+                if self.ttl_seconds and now - conversation.last_access > self.ttl_seconds:
+                    expired.append((user_id, conversation_id))
+                    continue
+                if after and (summary["updated_at"], conversation_id) >= after:
+                    continue
+                if limit is not None and len(result) == limit:
+                    next_cursor = _encode_cursor(result[-1])
+                    break
+                result.append(dict(summary))
+            for key in expired:
+                self._remove(key)
+        return result, next_cursor
+
+    def get_context_state(self, user_id: str, conversation_id: str) -> ContextState:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            return conversation.context if conversation is not None else (0, None)
+
+    def set_context_state(self, user_id: str, conversation_id: str, start: int, summary: Optional[str]) -> None:
+        with self._lock:
+            conversation = self._touch((user_id, conversation_id))
+            if conversation is not None and start >= conversation.context[0]:
+                conversation.context = (start, summary)
+
+
+# =============================================================================
+# Backend SQLite
+# =============================================================================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    last_message TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    token_total INTEGER NOT NULL DEFAULT 0,
+    context_start INTEGER NOT NULL DEFAULT 0,
+    context_summary TEXT,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS conversations_recent
+    ON conversations (user_id, updated_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    cum_tokens INTEGER NOT NULL,
+    PRIMARY KEY (user_id, conversation_id, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_cum_tokens
+    ON messages (user_id, conversation_id, cum_tokens);
+"""
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Backend SQLite em modo WAL. Vários workers (processos) podem apontar para
+    o mesmo arquivo e enxergam o mesmo histórico.
+
+    Args:
+        path: Caminho do arquivo do banco
+        timeout: Tempo máximo (s) de espera por locks de escrita
+        token_counter: Função de contagem de tokens de um texto
+        max_cached: Conversas com a janela de mensagens do LangChain mantida
+            em cache no processo (só as mensagens a partir de `offset`)
+        workers: Threads que executam as chamadas vindas do event loop (`run`)
+    """
+
+    def __init__(
+        self,
+        path: str = "conversations.db",
+        timeout: float = 5.0,
+        token_counter: Optional[Callable[[str], int]] = None,
+        max_cached: int = 1000,
+        workers: int = 4,
+    ):
+        if token_counter is not None:
+            self.token_counter = token_counter
+        self.path = path
+        self.timeout = timeout
+        self.max_cached = max_cached
+        # Uma conexão por thread: poucas threads dedicadas mantêm poucas conexões
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sqlite-store")
+        # Mensagens já convertidas por conversa, a partir do início da janela:
+        # (posição da primeira, mensagens). Completadas com as que outros
+        # workers gravaram desde a última leitura
+        self._langchain_cache: "OrderedDict[Tuple[str, str], Tuple[int, list]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        connection = self._connection()
+        connection.executescript(_SCHEMA)
+        # Bancos criados antes do estado da janela de contexto
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(conversations)")}
+        if "context_start" not in columns:
+            connection.execute(
+                "ALTER TABLE conversations ADD COLUMN context_start INTEGER NOT NULL DEFAULT 0")
+            connection.execute("ALTER TABLE conversations ADD COLUMN context_summary TEXT")
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Uma conexão por thread (sqlite3 não compartilha conexões entre threads).
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # check_same_thread=False só para o close() poder fechar todas
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    async def run(self, method: Callable[..., T], *args: Any) -> T:
+        # Com outro worker escrevendo, add_message pode esperar até `timeout`
+        # pelo lock: isso acontece na thread, sem travar o event loop
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(method, *args))
+
+    def get_or_create_conversation(self, user_id: str, conversation_id: Optional[str] = None) -> str:
+        if conversation_id and self.has_conversation(user_id, conversation_id):
+            return conversation_id
+        new_id = str(uuid.uuid4())
+        created_at = _now_iso()
+        self._connection().execute(
+            "INSERT INTO conversations (user_id, id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, new_id, created_at, created_at),
+        )
+        return new_id
+
+    def has_conversation(self, user_id: str, conversation_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id),
+        ).fetchone()
+        return row is not None
+
+    def add_message(self, user_id: str, conversation_id: str, role: str, content: str) -> None:
+        timestamp = _now_iso()
+        tokens = self.token_counter(content)
+        connection = self._connection()
+        # BEGIN IMMEDIATE garante o próximo seq sem corrida entre workers
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR IGNORE INTO conversations (user_id, id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (user_id, conversation_id, timestamp, timestamp),
+            )
+            # message_count é o próximo seq da conversa
+            seq, cum_tokens = connection.execute(
+                "UPDATE conversations "
+                "SET updated_at = ?, last_message = ?, message_count = message_count + 1, "
+                "    token_total = token_total + ? "
+                "WHERE user_id = ? AND id = ? RETURNING message_count - 1, token_total",
+                (timestamp, content, tokens, user_id, conversation_id),
+            ).fetchone()
+            connection.execute(
+                "INSERT INTO messages (user_id, conversation_id, seq, role, content, timestamp, cum_tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, conversation_id, seq, role, content, timestamp, cum_tokens),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get_messages(
+        self,
+        user_id: str,
+        conversation_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        before: Optional[datetime] = None,
+    ) -> List[Dict]:
+        query = (
+            "SELECT role, content, timestamp FROM messages "
+            "WHERE user_id = ? AND conversation_id = ? AND seq >= ?"
+        )
+        params: list = [user_id, conversation_id, offset]
+        if before is not None:
+            query += " AND timestamp < ?"
+            params.append(_utc_iso(before))
+        # Com before + limit, busca as últimas antes do timestamp e reordena
+        newest_first = before is not None and limit is not None
+        query += " ORDER BY seq DESC" if newest_first else " ORDER BY seq"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        if newest_first:
+            rows.reverse()
+        return [dict(row) for row in rows]
+
+    def get_langchain_messages(self, user_id: str, conversation_id: str, offset: int = 0) -> list:
+        key = (user_id, conversation_id)
+        with self._cache_lock:
+            base, cached = self._langchain_cache.pop(key, (offset, []))
+        if offset < base or offset > base + len(cached):
+            base, cached = offset, []
+        elif offset > base:
+            # A janela deslizou: descarta as mensagens que saíram dela
+            del cached[:offset - base]
+            base = offset
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages "
+            "WHERE user_id = ? AND conversation_id = ? AND seq >= ? ORDER BY seq",
+            (user_id, conversation_id, base + len(cached)),
+        ).fetchall()
+        cached.extend(to_langchain_message(row["role"], row["content"]) for row in rows)
+        with self._cache_lock:
+            self._langchain_cache[key] = (base, cached)
+            while len(self._langchain_cache) > self.max_cached:
+                self._langchain_cache.popitem(last=False)
+        return list(cached)
+
+    def token_count(self, user_id: str, conversation_id: str, start: int = 0) -> int:
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT token_total, message_count FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id),
+        ).fetchone()
+        if row is None or start >= row["message_count"]:
+            return 0
+        if start <= 0:
+            return row["token_total"]
+        (previous,) = connection.execute(
+            "SELECT cum_tokens FROM messages WHERE user_id = ? AND conversation_id = ? AND seq = ?",
+            (user_id, conversation_id, start - 1),
+        ).fetchone()
+        return row["token_total"] - previous
+
+    def window_start(self, user_id: str, conversation_id: str, max_tokens: int) -> int:
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT token_total, message_count FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id),
+        ).fetchone()
+        if row is None or row["token_total"] <= max_tokens:
+            return 0
+        (seq,) = connection.execute(
+            "SELECT MIN(seq) FROM messages "
+            "WHERE user_id = ? AND conversation_id = ? AND cum_tokens >= ?",
+            (user_id, conversation_id, row["token_total"] - max_tokens),
+        ).fetchone()
+        return min(seq + 1, row["message_count"] - 1)
+
+    def list_conversations(self, user_id: str, cursor: Optional[str] = None, limit: Optional[int] = None) -> ConversationPage:
+        query = (
+            "SELECT id, created_at, updated_at, last_message, message_count "
+            "FROM conversations WHERE user_id = ?"
+        )
+        params: list = [user_id]
+        after = _decode_cursor(cursor)
+        if after:
+            query += " AND (updated_at, id) < (?, ?)"
+            params.extend(after)
+        query += " ORDER BY updated_at DESC, id DESC"
+        if limit is not None:
+            # Busca um item a mais para saber se existe próxima página
+            query += " LIMIT ?"
+            params.append(limit + 1)
+        result = [dict(row) for row in self._connection().execute(query, params)]
+        next_cursor = None
+        if limit is not None and len(result) > limit:
+            result = result[:limit]
+            next_cursor = _encode_cursor(result[-1])
+        return result, next_cursor
+
+    def get_context_state(self, user_id: str, conversation_id: str) -> ContextState:
+        row = self._connection().execute(
+            "SELECT context_start, context_summary FROM conversations WHERE user_id = ? AND id = ?",
+            (user_id, conversation_id),
+        ).fetchone()
+        return (row[0], row[1]) if row is not None else (0, None)
+
+    def set_context_state(self, user_id: str, conversation_id: str, start: int, summary: Optional[str]) -> None:
+        self._connection().execute(
+            "UPDATE conversations SET context_start = ?, context_summary = ? "
+            "WHERE user_id = ? AND id = ? AND context_start <= ?",
+            (start, summary, user_id, conversation_id, start),
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def create_conversation_store(
+    backend: str = "memory",
+    path: str = "conversations.db",
+    max_conversations: int = 10000,
+    ttl_seconds: float = 0,
+    max_bytes: int = 0,
+    token_counter: Optional[Callable[[str], int]] = None,
+) -> ConversationStore:
+    """
+    Cria o backend de conversas configurado (memory | sqlite).
+    """
+    backend = backend.lower()
+    if backend == "sqlite":
+        return SQLiteConversationStore(path, token_counter=token_counter)
+    if backend == "memory":
+        return InMemoryConversationStore(
+            max_conversations=max_conversations,
+            ttl_seconds=ttl_seconds,
+            max_bytes=max_bytes,
+            token_counter=token_counter,
+        )
+    raise Exception(f"Favor verificar o CONVERSATION_STORE ({backend})")
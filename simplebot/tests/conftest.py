@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do SimpleBot usam imports simples (ex.: `from store import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
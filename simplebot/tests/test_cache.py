@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+from cache import ResponseCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_key_keeps_case_and_collapses_whitespace():
+    key = ResponseCache.make_key("gpt-4o-mini", "Hello  world\n", 0.2)
+    assert key == ResponseCache.make_key("gpt-4o-mini", " Hello world", 0.2)
+    assert key != ResponseCache.make_key("gpt-4o-mini", "HELLO world", 0.2)
+
+    cache = ResponseCache()
+    run(cache.set("gpt-4o-mini", "Hello", 0.2, "oi"))
+    assert run(cache.get("gpt-4o-mini", "HELLO", 0.2)) is None
+    assert run(cache.get("gpt-4o-mini", "Hello", 0.2)) == "oi"
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path):
+    threads = []
+
+    class Recording(ResponseCache):
+        def _read_disk(self, key):
+            threads.append(threading.current_thread().name)
+            return super()._read_disk(key)
+
+    path = str(tmp_path / "cache.db")
+    writer = ResponseCache(db_path=path)
+    run(writer.set("m", "prompt", 0.2, "resposta"))
+    writer.close()
+
+    # Outro processo (memória vazia) encontra a resposta no disco
+    reader = Recording(db_path=path)
+    assert run(reader.get("m", "prompt", 0.2)) == "resposta"
+    assert threads and threads[0].startswith("response-cache")
+    reader.close()
+
+
+def test_embedding_failure_is_a_miss():
+    calls = []
+
+    async def embed(text):
+        calls.append(text)
+        if len(calls) > 1:
+            raise ConnectionError("embedding fora do ar")
+        return [1.0, 0.0]
+
+    cache = ResponseCache(embed=embed)
+    run(cache.set("m", "primeiro", 0.2, "resposta"))
+    # get: a falha vira falta, sem exceção
+    assert run(cache.get("m", "segundo", 0.2)) is None
+    assert cache.misses == 1
+    # set: a resposta fica no cache exato, fora do índice semântico
+    run(cache.set("m", "terceiro", 0.2, "outra"))
+    assert run(cache.get("m", "terceiro", 0.2)) == "outra"
+
+
+def test_semantic_match():
+    vectors = {
+        "qual a capital da frança?": [1.0, 0.0],
+        "capital da frança?": [0.99, 0.05],
+        "receita de bolo": [0.0, 1.0],
+    }
+
+    async def embed(text):
+        return vectors[text.lower()]
+
+    cache = ResponseCache(embed=embed, similarity_threshold=0.95)
+    run(cache.set("m", "Qual a capital da França?", 0.2, "Paris"))
+    assert run(cache.get("m", "capital da França?", 0.2)) == "Paris"
+    assert run(cache.get("m", "receita de bolo", 0.2)) is None
+    assert run(cache.get("m", "capital da França?", 0.2, semantic=False)) is None
+    assert cache.semantic_hits == 1
+
+
+def test_disk_entry_expires(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(ttl_seconds=0.001, db_path=path)
+    run(cache.set("m", "prompt", 0.2, "resposta"))
+    cache._memory.clear()
+    run(asyncio.sleep(0.01))
+    assert run(cache.get("m", "prompt", 0.2)) is None
+    cache.close()
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from context import ContextWindow
+from scheduler import INTERACTIVE, LLMScheduler
+from store import InMemoryConversationStore
+
+
+class CountingLLM:
+    """
+    FakeListChatModel que guarda as entradas de cada chamada de resumo.
+    """
+
+    def __init__(self):
+        self.model = FakeListChatModel(responses=[f"resumo {n}" for n in range(1, 51)])
+        self.inputs = []
+
+    async def ainvoke(self, messages):
+        self.inputs.append(messages[-1].content)
+        return await self.model.ainvoke(messages)
+
+
+@pytest.fixture
+def store():
+    # Toda mensagem custa 10 tokens: as contas da janela ficam previsíveis
+    store = InMemoryConversationStore(token_counter=lambda text: 10)
+    store.get_or_create_conversation("u", "c")
+    return store
+
+
+def add(store, count, start=0):
+    for i in range(start, start + count):
+        store.add_message("u", "c", "user" if i % 2 == 0 else "assistant", f"mensagem {i}")
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_window_slides_and_persists_start(store):
+    llm = CountingLLM()
+    window = ContextWindow(store, max_tokens=50, summary_llm=llm, slide_ratio=0.5)
+
+    add(store, 5)
+    messages = asyncio.run(window.build("u", "c"))
+    # 50 tokens cabem no orçamento: nada desliza
+    assert contents(messages) == [f"mensagem {i}" for i in range(5)]
+    assert store.get_context_state("u", "c") == (0, None)
+    assert llm.inputs == []
+
+    add(store, 1, start=5)
+    messages = asyncio.run(window.build("u", "c"))
+    # 60 > 50: a janela desliza até 25 tokens (as 2 últimas mensagens)
+    assert store.get_context_state("u", "c") == (4, "resumo 1")
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[0].content.endswith("resumo 1")
+    assert contents(messages[1:]) == ["mensagem 4", "mensagem 5"]
+    assert "mensagem 0" in llm.inputs[0] and "mensagem 3" in llm.inputs[0]
+    assert "mensagem 4" not in llm.inputs[0]
+
+
+def test_summary_rebuilt_only_when_window_slides(store):
+    llm = CountingLLM()
+    window = ContextWindow(store, max_tokens=50, summary_llm=llm, slide_ratio=0.5)
+
+    add(store, 6)
+    asyncio.run(window.build("u", "c"))
+    assert len(llm.inputs) == 1
+
+    # Janela com 2, 3 e 4 mensagens: cabe no orçamento, o resumo é reaproveitado
+    for i in range(6, 9):
+        add(store, 1, start=i)
+        messages = asyncio.run(window.build("u", "c"))
+        assert messages[0].content.endswith("resumo 1")
+    assert len(llm.inputs) == 1
+
+    add(store, 1, start=9)
+    messages = asyncio.run(window.build("u", "c"))
+    assert len(llm.inputs) == 2
+    # O resumo novo parte do anterior e só recebe as mensagens que saíram
+    assert "Resumo anterior: resumo 1" in llm.inputs[1]
+    assert "mensagem 3" not in llm.inputs[1]
+    assert store.get_context_state("u", "c") == (8, "resumo 2")
+    assert contents(messages[1:]) == ["mensagem 8", "mensagem 9"]
+
+
+def test_last_message_always_included():
+    # A última mensagem sozinha já estoura o orçamento
+    store = InMemoryConversationStore(token_counter=lambda text: len(text))
+    store.get_or_create_conversation("u", "c")
+    store.add_message("u", "c", "user", "curta")
+    store.add_message("u", "c", "user", "x" * 500)
+    window = ContextWindow(store, max_tokens=50, summary_llm=CountingLLM())
+
+    messages = asyncio.run(window.build("u", "c"))
+    assert isinstance(messages[-1], HumanMessage)
+    assert messages[-1].content == "x" * 500
+
+
+def test_state_shared_between_windows(store):
+    # Outro worker (ou um restart) continua da janela gravada no store
+    add(store, 6)
+    asyncio.run(ContextWindow(store, max_tokens=50, summary_llm=CountingLLM()).build("u", "c"))
+
+    llm = CountingLLM()
+    messages = asyncio.run(ContextWindow(store, max_tokens=50, summary_llm=llm).build("u", "c"))
+    assert llm.inputs == []
+    assert messages[0].content.endswith("resumo 1")
+    assert contents(messages[1:]) == ["mensagem 4", "mensagem 5"]
+
+
+def test_summary_input_is_capped(store):
+    llm = CountingLLM()
+    window = ContextWindow(store, max_tokens=50, summary_llm=llm, max_summary_calls=3)
+
+    # Histórico longo resumido de uma vez (ex.: primeira montagem após migrar)
+    add(store, 1000)
+    messages = asyncio.run(window.build("u", "c"))
+    assert len(llm.inputs) == 3
+    # Cada chamada recebe no máximo 5 mensagens (50 tokens)
+    assert all(text.count("mensagem") <= 5 for text in llm.inputs)
+    # As mais recentes entre as que saíram entram no resumo
+    assert "mensagem 997" in llm.inputs[-1]
+    assert contents(messages[1:]) == ["mensagem 998", "mensagem 999"]
+
+
+def test_summary_calls_go_through_scheduler(store):
+    waits = []
+    scheduler = LLMScheduler(max_concurrent=1, on_wait=lambda waited, priority: waits.append(priority))
+    llm = CountingLLM()
+
+    async def ainvoke(messages):
+        # A chamada ocupa a vaga do escalonador enquanto roda
+        assert scheduler.active == 1
+        return await CountingLLM.ainvoke(llm, messages)
+
+    llm.ainvoke = ainvoke
+    window = ContextWindow(store, max_tokens=50, summary_llm=llm, scheduler=scheduler)
+    add(store, 6)
+    asyncio.run(window.build("u", "c"))
+    assert len(llm.inputs) == 1
+    assert waits == [INTERACTIVE]
+    assert scheduler.active == 0
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from limits import RateLimitItemPerMinute
+from limits.strategies import FixedWindowRateLimiter
+
+import ratelimit
+from ratelimit import BatchedStorage, SQLiteStorage
+
+
+@pytest.fixture
+def uri(tmp_path):
+    return f"sqlite:///{tmp_path}/ratelimit.db"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Relógio controlado pelo teste (time.time usado pelos storages).
+    """
+    now = [time.time()]
+    monkeypatch.setattr(ratelimit.time, "time", lambda: now[0])
+    return now
+
+
+def test_sqlite_count_shared_between_instances(uri):
+    # Duas instâncias no mesmo arquivo fazem o papel de dois workers
+    worker_a = SQLiteStorage(uri)
+    worker_b = SQLiteStorage(uri)
+
+    assert worker_a.incr("login:1.2.3.4", 60) == 1
+    assert worker_b.incr("login:1.2.3.4", 60) == 2
+    assert worker_a.incr("login:1.2.3.4", 60, amount=3) == 5
+    assert worker_b.get("login:1.2.3.4") == 5
+    assert worker_a.get("outra") == 0
+
+
+def test_sqlite_window_resets_on_expiry(uri, clock):
+    storage = SQLiteStorage(uri)
+    storage.incr("chave", 60)
+    storage.incr("chave", 60)
+    assert storage.get("chave") == 2
+
+    clock[0] += 61
+    assert storage.get("chave") == 0
+    # A primeira batida da nova janela reinicia a contagem e a expiração
+    assert storage.incr("chave", 60) == 1
+    assert storage.get_expiry("chave") == pytest.approx(clock[0] + 60)
+
+
+def test_batched_overshoot_is_bounded(uri):
+    sync_every = 5
+    workers = [BatchedStorage(f"batched+{uri}", sync_every=sync_every, sync_interval=3600) for _ in range(2)]
+    limiters = [FixedWindowRateLimiter(worker) for worker in workers]
+    limit = RateLimitItemPerMinute(30)
+
+    admitted = 0
+    for attempt in range(200):
+        if limiters[attempt % 2].hit(limit, "chat", "user"):
+            admitted += 1
+
+    # Cada worker pode deixar passar até sync_every - 1 batidas ainda não sincronizadas
+    assert 30 <= admitted <= 30 + len(workers) * (sync_every - 1)
+
+
+def test_batched_flush_sends_pending_hits(uri):
+    shared = SQLiteStorage(uri)
+    batched = BatchedStorage(f"batched+{uri}", sync_every=10, sync_interval=3600)
+
+    for _ in range(4):
+        batched.incr("chave", 60)
+    # Só a primeira batida da janela foi sincronizada
+    assert shared.get("chave") == 1
+    assert batched.get("chave") == 4
+
+    batched.flush()
+    assert shared.get("chave") == 4
+    # Nada pendente: um segundo flush não conta de novo
+    batched.flush()
+    assert shared.get("chave") == 4
@@ -0,0 +1,195 @@
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import store
+from store import MESSAGE_OVERHEAD_BYTES, InMemoryConversationStore, SQLiteConversationStore
+
+START = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Timestamps gravados avançam 1 s por chamada (a partir de START).
+    """
+    ticks = iter(range(1_000_000))
+    monkeypatch.setattr(store, "_now_iso", lambda: (START + timedelta(seconds=next(ticks))).isoformat())
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def conversations(request, tmp_path, clock):
+    # Toda mensagem custa 10 tokens
+    if request.param == "memory":
+        backend = InMemoryConversationStore(token_counter=lambda text: 10)
+    else:
+        backend = SQLiteConversationStore(str(tmp_path / "conversations.db"), token_counter=lambda text: 10)
+    yield backend
+    backend.close()
+
+
+def fill(backend, count, user_id="u", conversation_id="c"):
+    # add_message cria a conversa com o id informado
+    for i in range(count):
+        backend.add_message(user_id, conversation_id, "user" if i % 2 == 0 else "assistant", f"mensagem {i}")
+
+
+def contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_create_and_read_messages(conversations):
+    conversation_id = conversations.get_or_create_conversation("u")
+    assert conversations.has_conversation("u", conversation_id)
+    assert not conversations.has_conversation("outro", conversation_id)
+    assert conversations.get_or_create_conversation("u", conversation_id) == conversation_id
+    assert conversations.get_or_create_conversation("u", "inexistente") != "inexistente"
+
+    fill(conversations, 5, conversation_id=conversation_id)
+    assert contents(conversations.get_messages("u", conversation_id)) == [f"mensagem {i}" for i in range(5)]
+    assert contents(conversations.get_messages("u", conversation_id, offset=1, limit=2)) == ["mensagem 1", "mensagem 2"]
+    assert conversations.get_messages("u", "inexistente") == []
+
+    langchain = conversations.get_langchain_messages("u", conversation_id, 3)
+    assert [type(message).__name__ for message in langchain] == ["AIMessage", "HumanMessage"]
+    assert langchain[-1].content == "mensagem 4"
+
+
+def test_messages_before_timestamp(conversations):
+    # Um segundo entre as mensagens: antes da 4ª ficam 3
+    fill(conversations, 5)
+    before = datetime.fromisoformat(conversations.get_messages("u", "c")[3]["timestamp"])
+    assert contents(conversations.get_messages("u", "c", before=before)) == [f"mensagem {i}" for i in range(3)]
+    assert contents(conversations.get_messages("u", "c", before=before, limit=2)) == ["mensagem 1", "mensagem 2"]
+    # O mesmo instante em outro fuso, ou sem fuso (UTC), dá a mesma página
+    other_zone = before.astimezone(timezone(timedelta(hours=-3)))
+    assert len(conversations.get_messages("u", "c", before=other_zone)) == 3
+    assert len(conversations.get_messages("u", "c", before=before.replace(tzinfo=None))) == 3
+
+
+def test_list_conversations_paginates_by_activity(conversations):
+    for conversation_id in ["a", "b", "c"]:
+        fill(conversations, 1, conversation_id=conversation_id)
+    conversations.add_message("u", "a", "user", "de novo")
+
+    page, cursor = conversations.list_conversations("u", limit=2)
+    assert [summary["id"] for summary in page] == ["a", "c"]
+    assert page[0]["last_message"] == "de novo"
+    assert page[0]["message_count"] == 2
+    page, cursor = conversations.list_conversations("u", cursor=cursor, limit=2)
+    assert [summary["id"] for summary in page] == ["b"]
+    assert cursor is None
+    assert conversations.list_conversations("outro") == ([], None)
+
+
+def test_token_window(conversations):
+    fill(conversations, 10)
+    assert conversations.token_count("u", "c") == 100
+    assert conversations.token_count("u", "c", 7) == 30
+    assert conversations.window_start("u", "c", 200) == 0
+    assert conversations.window_start("u", "c", 35) == 7
+    # A última mensagem sempre entra na janela
+    assert conversations.window_start("u", "c", 5) == 9
+
+
+def test_context_state_never_moves_back(conversations):
+    fill(conversations, 3)
+    assert conversations.get_context_state("u", "c") == (0, None)
+    conversations.set_context_state("u", "c", 2, "resumo")
+    conversations.set_context_state("u", "c", 1, "antigo")
+    assert conversations.get_context_state("u", "c") == (2, "resumo")
+
+
+def test_run_uses_backend_thread(conversations):
+    fill(conversations, 1)
+
+    async def main():
+        return await conversations.run(lambda: threading.current_thread().name)
+
+    name = asyncio.run(main())
+    if isinstance(conversations, SQLiteConversationStore):
+        assert name.startswith("sqlite-store")
+    else:
+        assert name == threading.current_thread().name
+
+
+def test_memory_evicts_least_recently_used(clock):
+    backend = InMemoryConversationStore(max_conversations=2)
+    for conversation_id in ["a", "b"]:
+        fill(backend, 1, conversation_id=conversation_id)
+    backend.has_conversation("u", "a")
+    fill(backend, 1, conversation_id="c")
+    assert not backend.has_conversation("u", "b")
+    assert backend.has_conversation("u", "a") and backend.has_conversation("u", "c")
+    assert [summary["id"] for summary in backend.list_conversations("u")[0]] == ["c", "a"]
+
+
+def test_memory_expires_by_ttl(monkeypatch, clock):
+    now = [1000.0]
+    monkeypatch.setattr(store.time, "monotonic", lambda: now[0])
+    backend = InMemoryConversationStore(ttl_seconds=60)
+    fill(backend, 1, conversation_id="a")
+    now[0] += 61
+    assert backend.list_conversations("u") == ([], None)
+    assert not backend.has_conversation("u", "a")
+
+
+def test_memory_bytes_cap_counts_overhead(clock):
+    # Cabem duas mensagens de 100 caracteres, contando as estruturas de cada uma
+    backend = InMemoryConversationStore(max_bytes=2 * (100 + MESSAGE_OVERHEAD_BYTES))
+    for conversation_id in ["a", "b", "c"]:
+        backend.add_message("u", conversation_id, "user", "x" * 100)
+    assert not backend.has_conversation("u", "a")
+    assert backend.has_conversation("u", "b") and backend.has_conversation("u", "c")
+    assert backend.total_bytes == 2 * (100 + MESSAGE_OVERHEAD_BYTES)
+
+
+def test_sqlite_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / "conversations.db")
+    worker_a = SQLiteConversationStore(path)
+    worker_b = SQLiteConversationStore(path)
+    fill(worker_a, 2)
+    assert len(worker_b.get_langchain_messages("u", "c")) == 2
+    worker_a.add_message("u", "c", "user", "nova")
+    # O cache de mensagens do LangChain é completado com as gravadas pelo outro worker
+    assert worker_b.get_langchain_messages("u", "c", 1)[-1].content == "nova"
+    worker_b.set_context_state("u", "c", 1, "resumo")
+    assert worker_a.get_context_state("u", "c") == (1, "resumo")
+    worker_a.close()
+    worker_b.close()
+
+
+def test_sqlite_langchain_cache_keeps_only_the_window(tmp_path, clock):
+    backend = SQLiteConversationStore(str(tmp_path / "conversations.db"))
+    fill(backend, 50)
+    assert len(backend.get_langchain_messages("u", "c", 40)) == 10
+    start, cached = backend._langchain_cache[("u", "c")]
+    assert (start, len(cached)) == (40, 10)
+    # A janela desliza: o cache é rebaseado sem reler o início
+    assert backend.get_langchain_messages("u", "c", 45)[0].content == "mensagem 45"
+    start, cached = backend._langchain_cache[("u", "c")]
+    assert (start, len(cached)) == (45, 5)
+    assert len(backend.get_langchain_messages("u", "c")) == 50
+    backend.close()
+
+
+def test_sqlite_migrates_old_schema(tmp_path, clock):
+    path = str(tmp_path / "conversations.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE conversations (user_id TEXT NOT NULL, id TEXT NOT NULL, created_at TEXT NOT NULL, "
+        "updated_at TEXT NOT NULL, last_message TEXT, message_count INTEGER NOT NULL DEFAULT 0, "
+        "token_total INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, id))"
+    )
+    connection.execute("INSERT INTO conversations (user_id, id, created_at, updated_at) VALUES ('u', 'c', 'x', 'x')")
+    connection.commit()
+    connection.close()
+
+    backend = SQLiteConversationStore(path)
+    assert backend.get_context_state("u", "c") == (0, None)
+    backend.set_context_state("u", "c", 3, "resumo")
+    assert backend.get_context_state("u", "c") == (3, "resumo")
+    backend.close()